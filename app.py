@@ -1,8 +1,14 @@
 from functions import *
-from dmi_cache import start_dmi_cache_worker, get_cached_date_range
+from dmi_cache import start_dmi_cache_worker, get_cached_date_range, get_backfill_progress
+from battery import simulate_battery, align_production, interval_hours
+from result_store import get_result_store, new_session_id
+import singleflight
+from timeseries_view import build_pyramid, relayout_window, select_view
 from datetime import datetime, timedelta
+import os
+import diskcache
 import dash
-from dash import html, dcc, Input, Output, State
+from dash import html, dcc, Input, Output, State, DiskcacheManager
 
 import dash_bootstrap_components as dbc
 import plotly.express as px
@@ -13,16 +19,30 @@ N_CLICKS = None
 df_mps = pd.DataFrame(columns=['Målepunkts ID', 'Info'])
 df_mp_data = None
 
-# Determine available weather data range from cache
-cached_range = get_cached_date_range()
-if cached_range:
-    pv_min_date, pv_max_date = cached_range
-else:
-    pv_min_date = datetime.utcnow().date() - timedelta(days=30)
-    pv_max_date = datetime.utcnow().date()
+# How often the date picker limits follow the weather cache
+DMI_RANGE_REFRESH_MS = 10 * 60 * 1000
+
+
+def get_pv_date_limits():
+    """Return the available weather data range from the cache manifest."""
+    cached_range = get_cached_date_range()
+    if cached_range:
+        return cached_range
+    return datetime.utcnow().date() - timedelta(days=30), datetime.utcnow().date()
+
+
+pv_min_date, pv_max_date = get_pv_date_limits()
+
+# Slow callbacks run as background jobs; their state is kept on disk so any
+# server process can report progress and return the result
+BACKGROUND_CACHE_DIR = os.environ.get("BACKGROUND_CACHE_DIR", os.path.join("cache", "background"))
+BACKGROUND_JOB_EXPIRE = int(os.environ.get("BACKGROUND_JOB_EXPIRE", "3600"))
+background_callback_manager = DiskcacheManager(
+    diskcache.Cache(BACKGROUND_CACHE_DIR), expire=BACKGROUND_JOB_EXPIRE)
 
 # Initialize the app
-app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
+app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP],
+                background_callback_manager=background_callback_manager)
 
 app.layout = dbc.Container([
     html.Br(),
@@ -83,19 +103,25 @@ app.layout = dbc.Container([
                     html.Br(),
                     dbc.Button('Hent data',
                                id='fetch-data-button', n_clicks=0),
+                    dbc.Button('Annullér', id='cancel-metering-button', n_clicks=0,
+                               color='secondary', disabled=True),
+                    html.Br(),
+                    dbc.Progress(id='metering-progress', value=0),
                     dcc.Loading(id='consumption-graph-placeholder', children=[dbc.Alert(
                         "Data vises her, når at de er hentet korrekt.", color="info")])
                 ]),
             ])
 
     ]),
+    # Result DataFrames stay on the server; the stores below only hold handles
+    dcc.Store(id='session-id', storage_type='session'),
     dcc.Store(id='eloverblik_api_key', storage_type='local'),
     dcc.Store(id='eloverblik_metering_points'),
     dcc.Store(id='eloverblik_selected_metering_point'),
     dcc.Store(id='eloverblik_consumption_data'),
-    dcc.Store(id='eloverblik_production_data'),
+    dcc.Store(id='metering_pyramid'),
     dcc.Store(id='pv_configuration', storage_type='local'),
-    dcc.Store(id='pv_production_data'),
+    dcc.Interval(id='dmi-range-interval', interval=DMI_RANGE_REFRESH_MS),
 
     html.Br(),
 
@@ -155,9 +181,31 @@ app.layout = dbc.Container([
             html.Br(),
             dbc.Button("Simulér produktion",
                        id="simulate-pv-button", n_clicks=0, color="primary"),
+            dbc.Button("Annullér", id="cancel-pv-button", n_clicks=0,
+                       color="secondary", disabled=True),
+            html.Br(),
+            dbc.Progress(id='pv-progress', value=0),
             html.Br(),
             dcc.Loading(id='pv-production-result', children=[dbc.Alert(
-                "Resultat vises her efter beregning", color="info")])
+                "Resultat vises her efter beregning", color="info")]),
+            html.Br(),
+            html.H6("Batteri og eget forbrug"),
+            dbc.Button("Beregn batteri",
+                       id="simulate-battery-button", n_clicks=0, color="primary"),
+            html.Br(),
+            dcc.Loading(id='battery-result', children=[dbc.Alert(
+                "Eget forbrug med og uden batteri vises her for forbrugsperioden", color="info")]),
+            html.Br(),
+            html.H6("Find bedste anlæg"),
+            dbc.Button("Beregn alle størrelser og placeringer",
+                       id="sweep-pv-button", n_clicks=0, color="primary"),
+            dbc.Button("Annullér", id="cancel-sweep-button", n_clicks=0,
+                       color="secondary", disabled=True),
+            html.Br(),
+            dbc.Progress(id='sweep-progress', value=0),
+            html.Br(),
+            dcc.Loading(id='sweep-result', children=[dbc.Alert(
+                "De bedste kombinationer af størrelse, placering og hældning vises her", color="info")])
         ])
     ]),
 
@@ -209,7 +257,10 @@ def display_saved_data(value):
     Output('table-placeholder', 'children'),
     Output('dropdown-measurepoints', 'options'),
     Input('fetch-measurepoints-button', 'n_clicks'),
-    State('input-apikey', 'value')
+    State('input-apikey', 'value'),
+    background=True,
+    running=[(Output('fetch-measurepoints-button', 'disabled'), True, False)],
+    prevent_initial_call=True
 
 )
 def get_metering_points_on_click(n_clicks, token):
@@ -254,30 +305,109 @@ def get_eloverblik_raw_data_1(metering_point):
     return (selected_metering_point)
 
 
+@app.callback(
+    Output('session-id', 'data'),
+    Input('session-id', 'modified_timestamp'),
+    State('session-id', 'data'),
+)
+def assign_session_id(modified_timestamp, session_id):
+    if session_id:
+        return dash.no_update
+    return new_session_id()
+
+
 @ app.callback(
     Output('consumption-graph-placeholder', 'children'),
+    Output('eloverblik_consumption_data', 'data'),
+    Output('metering_pyramid', 'data'),
     Input('eloverblik_selected_metering_point', 'data'),
     State('date-picker-range', 'start_date'),
     State('date-picker-range', 'end_date'),
     State('eloverblik_api_key', 'data'),
+    State('eloverblik_metering_points', 'data'),
+    State('session-id', 'data'),
+    background=True,
+    progress=[Output('metering-progress', 'value'), Output('metering-progress', 'label')],
+    running=[
+        (Output('dropdown-measurepoints', 'disabled'), True, False),
+        (Output('cancel-metering-button', 'disabled'), False, True),
+    ],
+    cancel=[Input('cancel-metering-button', 'n_clicks')],
+    prevent_initial_call=True
 
 
 )
-def get_eloverblik_raw_data_2(selected_metering_point, start_date, end_date, token):
+def get_eloverblik_raw_data_2(set_progress, selected_metering_point, start_date, end_date, token,
+                              metering_points, session_id):
     graph = None
+    consumption_data = None
+    pyramid_data = None
 
     if (selected_metering_point is not None):
-        df_mp_data = get_metering_dataframe(
-            token, selected_metering_point, start_date, end_date)
-        
-        df_monthly = df_mp_data.resample('D').sum()
+        # Production points are fetched in the same request as the consumption point
+        production_points = [mp['meteringPointId'] for mp in metering_points or []
+                             if mp.get('typeOfMP') == 'E18'
+                             and mp['meteringPointId'] != selected_metering_point]
+        fetch_state = {'failed': 0}
+
+        def report(done, total, failed):
+            fetch_state['failed'] = failed
+            label = f"{done}/{total}" + (f", {failed} fejlede" if failed else "")
+            set_progress((100 * done // total, label))
+
+        # Full resolution is fetched for the zoomable analysis chart; the
+        # overview uses the daily level of its aggregate pyramid.
+        df_mp_data = get_metering_dataframes(
+            token, [selected_metering_point] + production_points, start_date, end_date, progress=report)
+        pyramid = build_pyramid(df_mp_data)
+
+        df_daily = pyramid['day'].tz_convert('Europe/Copenhagen')
+
+        fig = px.bar(df_daily)
+        graph = dcc.Graph(figure=fig)
+        if fetch_state['failed']:
+            # Some windows could not be fetched; the chart has gaps
+            graph = html.Div([dbc.Alert(
+                f"{fetch_state['failed']} perioder kunne ikke hentes fra Eloverblik, så data er ufuldstændige. "
+                "Prøv igen senere.", color="warning"), graph])
 
-        print(df_monthly)
+        store = get_result_store()
+        consumption_data = store.put(session_id, 'consumption', df_mp_data[[selected_metering_point]])
+        pyramid_data = store.put(session_id, 'metering_pyramid', pyramid)
 
-        fig = px.bar(df_monthly)
-        graph = dcc.Graph(figure=fig)
-        
-    return graph
+    return graph, consumption_data, pyramid_data
+
+
+LEVEL_LABELS = {
+    'raw': 'måling',
+    'hour': 'time',
+    'day': 'dag',
+    'week': 'uge',
+    'month': 'måned',
+}
+
+
+@app.callback(
+    Output('bar-chart', 'figure'),
+    Input('metering_pyramid', 'data'),
+    Input('bar-chart', 'relayoutData'),
+    prevent_initial_call=True
+)
+def update_bar_chart(pyramid_handle, relayout):
+    """Draw the level of the metering pyramid that fits the visible window."""
+    pyramid = get_result_store().get(pyramid_handle)
+    if pyramid is None:
+        return dash.no_update
+    # New data is shown in full; zoom and pan events select a window
+    start, end = (None, None) if dash.ctx.triggered_id == 'metering_pyramid' else relayout_window(relayout)
+    level, view = select_view(pyramid, start, end)
+    fig = px.line(view.tz_convert('Europe/Copenhagen'),
+                  labels={'value': f'kWh pr. {LEVEL_LABELS[level]}', 'index': ''})
+    fig.update_layout(uirevision=pyramid_handle)
+    if start is not None:
+        fig.update_xaxes(range=[start.tz_convert('Europe/Copenhagen').tz_localize(None),
+                                end.tz_convert('Europe/Copenhagen').tz_localize(None)])
+    return fig
 
 
 @ app.callback(
@@ -324,25 +454,142 @@ def load_pv_configuration(data):
     return dash.no_update, dash.no_update, dash.no_update, dash.no_update
 
 
+@app.callback(
+    Output('pv-date-picker-range', 'min_date_allowed'),
+    Output('pv-date-picker-range', 'max_date_allowed'),
+    Input('dmi-range-interval', 'n_intervals'),
+)
+def refresh_pv_date_limits(n_intervals):
+    # The cache worker keeps extending the range while the app runs
+    return get_pv_date_limits()
+
+
 @app.callback(
     Output('pv-production-result', 'children'),
-    Output('pv_production_data', 'data'),
     Input('simulate-pv-button', 'n_clicks'),
     State('input-address', 'value'),
     State('input-pv-size', 'value'),
     State('dropdown-orientation', 'value'),
     State('pv-date-picker-range', 'start_date'),
     State('pv-date-picker-range', 'end_date'),
+    background=True,
+    progress=[Output('pv-progress', 'value'), Output('pv-progress', 'label')],
+    running=[
+        (Output('simulate-pv-button', 'disabled'), True, False),
+        (Output('cancel-pv-button', 'disabled'), False, True),
+    ],
+    cancel=[Input('cancel-pv-button', 'n_clicks')],
     prevent_initial_call=True
 )
-def simulate_pv(n_clicks, address, pv_size, orientation, start_date, end_date):
+def simulate_pv(set_progress, n_clicks, address, pv_size, orientation, start_date, end_date):
     if n_clicks and address and pv_size and orientation:
-        df = simulate_pv_production(address, start_date, end_date,
-                                    pv_size, orientation)
+        set_progress((10, "Beregner produktion"))
+        # The date picker follows the DMI cache, so model from its observations
+        df = simulate_pv_production(address, start_date,
+                                    pd.Timestamp(end_date) + pd.Timedelta(hours=23),
+                                    pv_size, orientation, source="dmi")
         df_daily = df.resample('D').sum()
         fig = px.line(df_daily, y='P', labels={'P': 'kWh'})
-        return dcc.Graph(figure=fig), df.to_json(date_format='iso')
-    return dash.no_update, dash.no_update
+        set_progress((100, "Færdig"))
+        return dcc.Graph(figure=fig)
+    return dash.no_update
+
+
+def _consumption(handle, token, metering_point, start_date, end_date):
+    """Return the consumption fetched for the overview, or fetch it if it is gone."""
+    frame = get_result_store().get(handle)
+    if frame is None or metering_point not in frame:
+        frame = get_metering_dataframe(token, metering_point, start_date, end_date)
+    return frame[metering_point]
+
+
+BATTERY_SUMMARY_COLUMNS = {
+    'battery_kwh': 'Batteri (kWh)',
+    'import_kwh': 'Køb fra net (kWh)',
+    'export_kwh': 'Salg til net (kWh)',
+    'self_consumption_kwh': 'Eget forbrug (kWh)',
+    'self_consumption_ratio': 'Egetforbrugsandel',
+    'self_sufficiency': 'Selvforsyning',
+}
+
+
+@app.callback(
+    Output('battery-result', 'children'),
+    Input('simulate-battery-button', 'n_clicks'),
+    State('pv_configuration', 'data'),
+    State('input-address', 'value'),
+    State('eloverblik_selected_metering_point', 'data'),
+    State('eloverblik_api_key', 'data'),
+    State('date-picker-range', 'start_date'),
+    State('date-picker-range', 'end_date'),
+    State('eloverblik_consumption_data', 'data'),
+    prevent_initial_call=True
+)
+def simulate_battery_on_click(n_clicks, pv_configuration, address, metering_point, token,
+                              start_date, end_date, consumption_handle):
+    if not (n_clicks and pv_configuration and address and metering_point):
+        return dbc.Alert("Vælg et forbrugsmålepunkt og gem solcelleinfo først", color="warning")
+
+    pv_size = pv_configuration.get('pv_size_kw') or 0
+    battery_size = pv_configuration.get('battery_size_kwh') or 0
+    consumption = _consumption(consumption_handle, token, metering_point, start_date, end_date)
+    if consumption.empty:
+        return dbc.Alert("Ingen forbrugsdata i perioden", color="warning")
+
+    production = typical_pv_production(
+        address, consumption.index.min(), consumption.index.max(),
+        pv_size, pv_configuration.get('orientation'))
+    aligned = align_production(consumption, production['P'])
+
+    # Compare the saved size with no battery, half and double the size
+    sizes = sorted({0.0, battery_size / 2, float(battery_size), battery_size * 2.0})
+    result = simulate_battery(aligned['consumption'], aligned['production'], sizes,
+                              interval_hours=interval_hours(aligned.index))
+    summary = result.summary()[list(BATTERY_SUMMARY_COLUMNS)].rename(columns=BATTERY_SUMMARY_COLUMNS)
+    return dbc.Table.from_dataframe(summary.round(2), striped=True, bordered=True)
+
+
+SWEEP_SUMMARY_COLUMNS = {
+    'orientation': 'Placering',
+    'tilt': 'Hældning',
+    'pv_size_kw': 'Størrelse (kW)',
+    'production_kwh': 'Produktion (kWh/år)',
+    'self_consumption_ratio': 'Egetforbrugsandel',
+    'savings_per_year': 'Besparelse (kr/år)',
+    'payback_years': 'Tilbagebetaling (år)',
+}
+
+
+@app.callback(
+    Output('sweep-result', 'children'),
+    Input('sweep-pv-button', 'n_clicks'),
+    State('input-address', 'value'),
+    State('eloverblik_selected_metering_point', 'data'),
+    State('eloverblik_api_key', 'data'),
+    State('date-picker-range', 'start_date'),
+    State('date-picker-range', 'end_date'),
+    State('eloverblik_consumption_data', 'data'),
+    background=True,
+    progress=[Output('sweep-progress', 'value'), Output('sweep-progress', 'label')],
+    running=[
+        (Output('sweep-pv-button', 'disabled'), True, False),
+        (Output('cancel-sweep-button', 'disabled'), False, True),
+    ],
+    cancel=[Input('cancel-sweep-button', 'n_clicks')],
+    prevent_initial_call=True
+)
+def sweep_pv_on_click(set_progress, n_clicks, address, metering_point, token, start_date, end_date,
+                      consumption_handle):
+    if not (n_clicks and address and metering_point):
+        return dbc.Alert("Vælg et forbrugsmålepunkt og indtast en adresse først", color="warning")
+
+    set_progress((10, "Henter forbrug"))
+    consumption = _consumption(consumption_handle, token, metering_point, start_date, end_date)
+    set_progress((30, "Beregner anlæg"))
+    ranking = sweep_pv_systems(token, metering_point, address, start_date, end_date, consumption=consumption)
+    set_progress((100, "Færdig"))
+    top = ranking.head(10)[list(SWEEP_SUMMARY_COLUMNS)].rename(columns=SWEEP_SUMMARY_COLUMNS)
+    return dbc.Table.from_dataframe(top.round(2), striped=True, bordered=True)
 
 
 # @app.callback(
@@ -384,6 +631,18 @@ def simulate_pv(n_clicks, address, pv_size, orientation, start_date, end_date):
 # def update_date_range(n_clicks, start_date, end_date, number):
 #     if (n_clicks is not None) or (n_clicks is not N_CLICKS):
 #         # Here, you can includ
+@app.server.route('/stats/singleflight')
+def singleflight_stats():
+    """Upstream calls per group in this process; ``shared`` calls were saved."""
+    return singleflight.get_stats()
+
+
+@app.server.route('/stats/dmi-backfill')
+def dmi_backfill_stats():
+    """Days to fetch, fetched, cached and failed by the running or last DMI backfill."""
+    return get_backfill_progress()
+
+
 if __name__ == '__main__':
     start_dmi_cache_worker()
     app.run(debug=False, host='0.0.0.0', port=8050)
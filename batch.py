@@ -0,0 +1,226 @@
+"""
+Run the solar business case for many customers without the web app.
+
+    python batch.py customers.csv results/ --workers 8
+
+Each CSV row describes one customer with the columns ``token``,
+``metering_point``, ``address``, ``pv_size_kw`` and optionally ``id``,
+``orientation``, ``tilt``, ``battery_kwh``, ``price_area``, ``date_from``
+and ``date_to``. Rows are fetched, simulated and evaluated on a process
+pool sharing the on-disk caches and the upstream rate limits. Every finished
+row is appended to ``journal.jsonl`` in the output directory, so a crashed
+or interrupted run started again skips the rows already done; rows that
+failed are retried. The results of all finished rows are written to
+``results.npz`` (see :func:`columnar.load_columns`).
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from battery import align_production, interval_hours, simulate_battery
+from columnar import save_columns
+from functions import (get_metering_dataframe, get_tariff_schedule, simulate_pv_production,
+                       typical_pv_production)
+from spot_prices import spot_prices_for
+
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", str(os.cpu_count() or 4)))
+# Upstream limits for the whole run, shared by all workers
+BATCH_ELOVERBLIK_RATE = float(os.environ.get("BATCH_ELOVERBLIK_RATE", "2"))
+BATCH_PVGIS_RATE = float(os.environ.get("BATCH_PVGIS_RATE", "25"))
+JOURNAL_NAME = "journal.jsonl"
+RESULTS_NAME = "results.npz"
+# "typical" pairs any period with the PVGIS mean year, as the app's battery view does
+PV_SOURCE_CHOICES = ("typical", "pvgis", "dmi")
+
+# Row fields copied to the output next to the results
+ROW_COLUMNS = ("id", "metering_point", "address", "orientation", "price_area")
+RESULT_COLUMNS = (
+    "pv_size_kw", "tilt", "battery_kwh", "consumption_kwh", "production_kwh",
+    "self_consumption_ratio", "self_sufficiency", "battery_self_sufficiency",
+    "cost_per_year", "savings_per_year", "battery_savings_per_year",
+)
+
+
+def row_key(row: Dict[str, str]) -> str:
+    """Return the journal key of a row: its ``id`` or a hash of its contents."""
+    if row.get("id"):
+        return row["id"]
+    content = json.dumps(sorted(row.items()), ensure_ascii=False)
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()[:16]
+
+
+def read_rows(path: str) -> List[Dict[str, str]]:
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        rows = [{k.strip(): (v or "").strip() for k, v in row.items() if k} for row in csv.DictReader(f)]
+    for row in rows:
+        row["id"] = row_key(row)
+    return rows
+
+
+def read_journal(path: str) -> Dict[str, dict]:
+    """Return the latest journal entry of each row; a torn last line is ignored."""
+    entries: Dict[str, dict] = {}
+    if not os.path.exists(path):
+        return entries
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            entries[entry["id"]] = entry
+    return entries
+
+
+def _append(journal, entry: dict) -> None:
+    journal.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    journal.flush()
+    os.fsync(journal.fileno())
+
+
+def _prices(token: str, metering_point: str, index: pd.DatetimeIndex, area: str):
+    """Return the import and export price (DKK/kWh) at each timestamp."""
+    spot = spot_prices_for(index, area)
+    if np.isnan(spot).all():
+        raise ValueError(f"No spot prices for {area} in the period")
+    spot = np.where(np.isnan(spot), np.nanmean(spot), spot)
+    tariff = get_tariff_schedule(token, metering_point).prices(index)
+    return spot + tariff, spot
+
+
+def evaluate_row(row: Dict[str, str], pv_source: str) -> dict:
+    """Fetch, simulate and evaluate one customer; returns the result columns."""
+    token, metering_point, address = row["token"], row["metering_point"], row["address"]
+    date_to = row.get("date_to") or date.today().isoformat()
+    date_from = row.get("date_from") or (date.fromisoformat(date_to) - timedelta(days=365)).isoformat()
+    pv_size = float(row["pv_size_kw"])
+    orientation = row.get("orientation") or "Syd"
+    tilt = float(row.get("tilt") or 35)
+    battery_kwh = float(row.get("battery_kwh") or 0)
+
+    consumption = get_metering_dataframe(token, metering_point, date_from, date_to)[metering_point].dropna()
+    if consumption.empty:
+        raise ValueError("No consumption in the period")
+    start, end = consumption.index.min(), consumption.index.max()
+    if pv_source == "typical":
+        production = typical_pv_production(address, start, end, pv_size, orientation, tilt)
+    else:
+        production = simulate_pv_production(address, start.tz_convert(None), end.tz_convert(None),
+                                             pv_size, orientation, tilt, source=pv_source)
+    aligned = align_production(consumption, production["P"])
+    if aligned.empty:
+        raise ValueError("PV production does not cover the consumption period")
+
+    index = aligned.index
+    hours = interval_hours(index)
+    years = len(index) * hours / 8760
+    result = simulate_battery(aligned["consumption"], aligned["production"], [0.0, battery_kwh],
+                              interval_hours=hours)
+    summary = result.summary()
+    import_price, export_price = _prices(token, metering_point, index, row.get("price_area") or "DK1")
+    baseline = float(aligned["consumption"].to_numpy() @ import_price) / years
+    costs = (result.grid_import @ import_price - result.grid_export @ export_price) / years
+
+    return {
+        "pv_size_kw": pv_size,
+        "tilt": tilt,
+        "battery_kwh": battery_kwh,
+        "consumption_kwh": float(summary["consumption_kwh"].iloc[0]) / years,
+        "production_kwh": float(summary["production_kwh"].iloc[0]) / years,
+        "self_consumption_ratio": float(summary["self_consumption_ratio"].iloc[0]),
+        "self_sufficiency": float(summary["self_sufficiency"].iloc[0]),
+        "battery_self_sufficiency": float(summary["self_sufficiency"].iloc[1]),
+        "cost_per_year": baseline,
+        "savings_per_year": baseline - float(costs[0]),
+        "battery_savings_per_year": baseline - float(costs[1]),
+    }
+
+
+def _init_worker(eloverblik_rate: float, pvgis_rate: float) -> None:
+    import eloverblik_client
+    import pvgis_cache
+
+    eloverblik_client._limiter.set_rate(eloverblik_rate)
+    pvgis_cache._limiter.set_rate(pvgis_rate)
+
+
+def write_results(entries: Dict[str, dict], path: str) -> int:
+    """Write the finished rows of the journal to a columnar file and return their number."""
+    done = [entry for entry in entries.values() if entry["status"] == "ok"]
+    columns = {name: np.array([entry[name] for entry in done], dtype=str) for name in ROW_COLUMNS}
+    columns.update({name: np.array([entry["result"][name] for entry in done], dtype=np.float64)
+                    for name in RESULT_COLUMNS})
+    save_columns(path, columns)
+    return len(done)
+
+
+def run(input_csv: str, output_dir: str, workers: int = BATCH_WORKERS, pv_source: str = "typical",
+        eloverblik_rate: float = BATCH_ELOVERBLIK_RATE, pvgis_rate: float = BATCH_PVGIS_RATE,
+        limit: Optional[int] = None) -> Dict[str, int]:
+    """Evaluate the rows of ``input_csv`` not yet done and write ``results.npz`` to ``output_dir``."""
+    os.makedirs(output_dir, exist_ok=True)
+    journal_path = os.path.join(output_dir, JOURNAL_NAME)
+    entries = read_journal(journal_path)
+    rows = read_rows(input_csv)
+    pending = [row for row in rows if entries.get(row["id"], {}).get("status") != "ok"]
+    if limit is not None:
+        pending = pending[:limit]
+    counts = {"rows": len(rows), "skipped": len(rows) - len(pending), "ok": 0, "failed": 0}
+    print(f"{len(pending)} of {len(rows)} rows to run on {workers} workers")
+
+    try:
+        with open(journal_path, "a", encoding="utf-8") as journal, ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_worker,
+                initargs=(eloverblik_rate, pvgis_rate)) as pool:
+            futures = {pool.submit(evaluate_row, row, pv_source): row for row in pending}
+            for future in as_completed(futures):
+                row = futures[future]
+                entry = {name: row.get(name, "") for name in ROW_COLUMNS}
+                try:
+                    entry.update(status="ok", result=future.result())
+                    counts["ok"] += 1
+                except Exception as exc:
+                    entry.update(status="failed", error=f"{type(exc).__name__}: {exc}")
+                    counts["failed"] += 1
+                    print(f"Row {row['id']} failed: {entry['error']}")
+                entries[row["id"]] = entry
+                _append(journal, entry)
+    finally:
+        written = write_results(entries, os.path.join(output_dir, RESULTS_NAME))
+        print(f"Wrote {written} rows to {os.path.join(output_dir, RESULTS_NAME)}")
+    return counts
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run the solar business case for every row of a CSV.")
+    parser.add_argument("input_csv", help="CSV with one customer per row.")
+    parser.add_argument("output_dir", help="Directory for the journal and results.npz.")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="Worker processes.")
+    parser.add_argument("--pv-source", choices=PV_SOURCE_CHOICES, default="typical",
+                        help="PV production source: PVGIS typical year, PVGIS years or the DMI model.")
+    parser.add_argument("--eloverblik-rate", type=float, default=BATCH_ELOVERBLIK_RATE,
+                        help="Eloverblik requests per second across all workers.")
+    parser.add_argument("--pvgis-rate", type=float, default=BATCH_PVGIS_RATE,
+                        help="PVGIS requests per second across all workers.")
+    parser.add_argument("--limit", type=int, help="Run at most this many pending rows.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    counts = run(args.input_csv, args.output_dir, args.workers, args.pv_source,
+                 args.eloverblik_rate, args.pvgis_rate, args.limit)
+    print(f"{counts['ok']} rows done, {counts['failed']} failed, {counts['skipped']} already done")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+from dataclasses import dataclass
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+
+ArrayLike = Union[float, np.ndarray]
+
+BATTERY_EFFICIENCY = 0.9
+# Charge/discharge power as a fraction of capacity per hour when no limit is given
+BATTERY_C_RATE = 0.5
+
+
+@dataclass
+class BatteryResult:
+    """Energy flows (kWh per interval) with one row per battery capacity."""
+
+    capacities_kwh: np.ndarray
+    soc: np.ndarray
+    grid_import: np.ndarray
+    grid_export: np.ndarray
+    charge: np.ndarray
+    discharge: np.ndarray
+    consumption: np.ndarray
+    production: np.ndarray
+
+    def summary(self) -> pd.DataFrame:
+        """Return totals and ratios per capacity."""
+        consumption = self.consumption.sum()
+        production = self.production.sum()
+        grid_import = self.grid_import.sum(axis=1)
+        grid_export = self.grid_export.sum(axis=1)
+        self_consumption = production - grid_export
+        return pd.DataFrame({
+            "battery_kwh": self.capacities_kwh,
+            "consumption_kwh": consumption,
+            "production_kwh": production,
+            "import_kwh": grid_import,
+            "export_kwh": grid_export,
+            "self_consumption_kwh": self_consumption,
+            "self_consumption_ratio": self_consumption / production if production else np.nan,
+            "self_sufficiency": 1 - grid_import / consumption if consumption else np.nan,
+        })
+
+
+def simulate_battery(
+    consumption: np.ndarray,
+    production: np.ndarray,
+    capacities_kwh,
+    max_charge_kw: Optional[ArrayLike] = None,
+    max_discharge_kw: Optional[ArrayLike] = None,
+    efficiency: float = BATTERY_EFFICIENCY,
+    interval_hours: float = 1.0,
+    initial_soc: float = 0.0,
+) -> BatteryResult:
+    """Simulate a battery for several capacities at once.
+
+    ``consumption`` and ``production`` are energies (kWh) per interval of
+    ``interval_hours``. Surplus production charges the battery and deficits
+    are covered from it before importing from the grid. The round-trip
+    ``efficiency`` is split evenly between charging and discharging. Power
+    limits default to ``BATTERY_C_RATE`` times each capacity.
+
+    The state-of-charge recursion runs over time with NumPy operations
+    across all capacities, and the grid flows are derived from it afterwards
+    in one vectorised pass.
+    """
+    consumption = np.asarray(consumption, dtype=np.float64)
+    production = np.asarray(production, dtype=np.float64)
+    capacities = np.atleast_1d(np.asarray(capacities_kwh, dtype=np.float64))
+    if max_charge_kw is None:
+        max_charge_kw = capacities * BATTERY_C_RATE
+    if max_discharge_kw is None:
+        max_discharge_kw = capacities * BATTERY_C_RATE
+
+    eta = np.sqrt(efficiency)
+    # Energy limits per interval on the battery side
+    charge_limit = np.broadcast_to(np.asarray(max_charge_kw, dtype=np.float64) * interval_hours * eta,
+                                   capacities.shape).copy()
+    discharge_limit = np.broadcast_to(np.asarray(max_discharge_kw, dtype=np.float64) * interval_hours / eta,
+                                      capacities.shape).copy()
+
+    net = production - consumption
+    # Surplus/deficit converted to what can enter or leave the cells
+    stored = np.where(net > 0, net * eta, net / eta)
+
+    n = len(net)
+    soc = np.empty((len(capacities), n + 1))
+    soc[:, 0] = np.minimum(initial_soc, capacities)
+    step = np.empty_like(capacities)
+    for t in range(n):
+        s = stored[t]
+        current, following = soc[:, t], soc[:, t + 1]
+        if s >= 0:
+            np.minimum(charge_limit, s, out=step)
+            np.add(current, step, out=following)
+            np.minimum(following, capacities, out=following)
+        else:
+            np.minimum(discharge_limit, -s, out=step)
+            np.subtract(current, step, out=following)
+            np.maximum(following, 0.0, out=following)
+
+    delta = np.diff(soc, axis=1)
+    charge = np.maximum(delta, 0.0) / eta
+    discharge = np.maximum(-delta, 0.0) * eta
+    grid_export = np.maximum(net, 0.0) - charge
+    grid_import = np.maximum(-net, 0.0) - discharge
+    return BatteryResult(
+        capacities_kwh=capacities,
+        soc=soc[:, 1:],
+        grid_import=np.maximum(grid_import, 0.0),
+        grid_export=np.maximum(grid_export, 0.0),
+        charge=charge,
+        discharge=discharge,
+        consumption=consumption,
+        production=production,
+    )
+
+
+def interval_hours(index: pd.DatetimeIndex) -> float:
+    """Return the typical step of ``index`` in hours."""
+    if len(index) < 2:
+        return 1.0
+    return float(np.median(np.diff(index.as_unit("ns").asi8))) / pd.Timedelta(hours=1).value
+
+
+def align_production(consumption: pd.Series, production_w: pd.Series) -> pd.DataFrame:
+    """Align hourly PV power (W) to a consumption series (kWh per interval).
+
+    ``production_w`` is indexed by UTC timestamps (naive or aware) of hourly
+    mean power, as returned by ``simulate_pv_production``. The result has a
+    ``consumption`` and a ``production`` column in kWh per consumption
+    interval, restricted to timestamps covered by both series.
+    """
+    index = consumption.index
+    production_w = production_w.copy()
+    if production_w.index.tz is None:
+        production_w.index = production_w.index.tz_localize("UTC")
+    production_w.index = production_w.index.floor("h")
+    production_w = production_w[~production_w.index.duplicated()]
+    power_kw = production_w.reindex(index.floor("h")).to_numpy() / 1000
+    aligned = pd.DataFrame({
+        "consumption": consumption.to_numpy(),
+        "production": power_kw * interval_hours(index),
+    }, index=index)
+    return aligned.dropna()
@@ -0,0 +1,98 @@
+"""
+Compare peak memory of the JSON and streaming meter data decoders.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_memory --years 1 5
+
+A synthetic 15-minute ``gettimeseries`` response is written to a temporary
+file and each decoder runs in its own subprocess, so the reported peak RSS
+is not skewed by the other path.
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date
+
+from benchmarks.payloads import metering_result
+
+MODES = ("json", "stream")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--years", type=int, nargs="+", default=[1, 2, 5],
+                        help="Payload sizes in years.")
+    parser.add_argument("--resolution", default="PT15M", choices=["PT15M", "PT1H"])
+    parser.add_argument("--run", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--payload", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _current_rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * resource.getpagesize() / 2 ** 20
+
+
+def run_decoder(mode: str, payload: str) -> None:
+    """Decode ``payload`` with one path and print ``seconds peak_mb base_mb``.
+
+    ``base_mb`` is the resident size after imports, so ``peak_mb - base_mb``
+    is the peak growth caused by decoding.
+    """
+    import functions
+
+    base = _current_rss_mb()
+    start = time.perf_counter()
+    with open(payload, "rb") as f:
+        if mode == "json":
+            df = functions._data_to_dataframe(json.load(f)["result"])
+        else:
+            columns, _ = functions._stream_metering_data(f)
+            df = functions._columns_to_dataframe(columns)
+    elapsed = time.perf_counter() - start
+    assert len(df)
+    print(f"{elapsed} {_peak_rss_mb()} {base}")
+
+
+def main() -> None:
+    args = parse_args()
+    if args.run:
+        run_decoder(args.run, args.payload)
+        return
+
+    print(f"{'years':>5} {'MB json':>8} {'mode':>7} {'time [s]':>9} {'RSS growth [MB]':>14}")
+    for years in args.years:
+        data = metering_result(["571313100000000001"], date(2019, 1, 1),
+                               365 * years, args.resolution)
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+            json.dump({"result": data}, f)
+            payload = f.name
+        del data
+        size = os.path.getsize(payload) / 1e6
+        try:
+            for mode in MODES:
+                out = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.bench_memory",
+                     "--run", mode, "--payload", payload],
+                    check=True, capture_output=True, text=True,
+                ).stdout.split()
+                elapsed, peak, base = map(float, out[-3:])
+                print(f"{years:>5} {size:>8.1f} {mode:>7} {elapsed:>9.2f} {peak - base:>14.1f}")
+        finally:
+            os.remove(payload)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark ``functions._data_to_dataframe`` on synthetic Eloverblik payloads.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_parser --years 1 2 5
+
+The previous per-period ``pd.concat`` implementation is kept here as a
+reference so the speed-up can be measured on the same payloads.
+"""
+
+import argparse
+import time
+from datetime import date
+from typing import Callable, List
+
+import pandas as pd
+
+from functions import _data_to_dataframe
+from benchmarks.payloads import metering_result
+
+
+def legacy_data_to_dataframe(data):
+    df_out = pd.DataFrame()
+    measure_series = data[0]["MyEnergyData_MarketDocument"]["TimeSeries"]
+
+    for timeseries in measure_series:
+        days = timeseries["Period"]
+        mrid = timeseries["mRID"]
+
+        for day in days:
+            start_date = day["timeInterval"]["start"]
+            end_date = day["timeInterval"]["end"]
+            date_range = pd.date_range(
+                start=start_date, end=end_date, freq='h')[:-1]
+            measurement_data = [entry["out_Quantity.quantity"]
+                                for entry in day["Point"]]
+            df = pd.DataFrame(data=measurement_data,
+                              index=date_range, columns=[mrid])
+            df_out = pd.concat([df_out, df])
+        df_out[mrid] = pd.to_numeric(df_out[mrid])
+    return df_out
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--years", type=int, nargs="+", default=[1, 2, 5],
+                        help="Payload sizes in years.")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Timed runs per size; the best run is reported.")
+    parser.add_argument("--skip-legacy", action="store_true",
+                        help="Do not time the previous implementation.")
+    return parser.parse_args()
+
+
+def best_of(fn: Callable, data: List, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(data)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main() -> None:
+    args = parse_args()
+    print(f"{'years':>5} {'points':>9} {'parser [s]':>11} {'legacy [s]':>11}")
+    for years in args.years:
+        data = metering_result(["571313100000000001"], date(2019, 1, 1), 365 * years)
+        points = len(_data_to_dataframe(data))
+        new = best_of(_data_to_dataframe, data, args.repeat)
+        legacy = float("nan")
+        if not args.skip_legacy:
+            legacy = best_of(legacy_data_to_dataframe, data, 1)
+        print(f"{years:>5} {points:>9} {new:>11.3f} {legacy:>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
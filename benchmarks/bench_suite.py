@@ -0,0 +1,314 @@
+"""
+Time parsing, fetching, simulation and callbacks against local upstream stand-ins.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_suite --years 1 2 --latency 0.02
+
+A :mod:`benchmarks.standin` server answers every upstream call, so the
+timings are repeatable and need no network or credentials. Each data size
+runs in its own subprocess with empty caches in a temporary directory: the
+``*_cold`` cases include the upstream calls and the ``*_warm`` cases are
+served from the caches filled before them. Metering data covers ``years``
+years and DMI weather ``30 * years`` days. Upstream rate limits are switched
+off so only the app's own work and the stand-in latency are measured.
+
+The timings are compared with ``benchmarks/baseline.json``; a case slower
+than the baseline by more than ``--tolerance`` (and ``--min-delta``
+seconds) is reported as a regression and the exit status is 1. Use
+``--save-baseline`` to record a new baseline on the reference machine.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from io import BytesIO
+from typing import Callable, Dict, List, Optional
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+METERING_POINT = "571313100000000001"
+ADDRESS = "Standinvej 1, 8000 Aarhus C"
+TOKEN = "standin-refresh-token"
+# Metering periods end here, so payloads do not change from day to day
+PERIOD_END = date(2025, 1, 1)
+DMI_DAYS_PER_YEAR = 30
+
+# Cache locations, relative to the temporary directory of each run
+CACHE_ENV = {
+    "METERING_CACHE_DIR": "metering",
+    "PVGIS_CACHE_DIR": "pvgis",
+    "GEOCODE_CACHE_PATH": "geocode.sqlite3",
+    "DMI_CACHE_DIR": "dmi",
+    "WEATHER_STORE_DIR": "weather",
+    "SPOT_PRICE_CACHE_DIR": "spot_prices",
+    "RESULT_STORE_DIR": "results",
+    "BACKGROUND_CACHE_DIR": "background",
+    "RATE_LIMIT_DIR": "ratelimit",
+}
+NO_RATE_LIMITS = {
+    "NOMINATIM_RATE": "0",
+    "PVGIS_REQUESTS_PER_SECOND": "0",
+    "DMI_REQUESTS_PER_SECOND": "0",
+    "ELOVERBLIK_REQUESTS_PER_SECOND": "0",
+}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--years", type=int, nargs="+", default=[1, 2],
+                        help="Data sizes in years of metering data.")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Timed runs of warm cases; the best run is reported.")
+    parser.add_argument("--latency", type=float, default=0.02,
+                        help="Seconds the stand-in adds to every response.")
+    parser.add_argument("--resolution", default="PT1H", choices=["PT15M", "PT1H"],
+                        help="Resolution of the stand-in metering data.")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline JSON to compare with.")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Write the results to --baseline instead of comparing.")
+    parser.add_argument("--output", help="Also write the results to this JSON file.")
+    parser.add_argument("--tolerance", type=float, default=0.3,
+                        help="Allowed slowdown relative to the baseline (0.3 = 30%%).")
+    parser.add_argument("--min-delta", type=float, default=0.02,
+                        help="Slowdowns below this many seconds are ignored as noise.")
+    parser.add_argument("--run-years", type=int, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def best_of(fn: Callable[[], object], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def dash_callback(client, outputs: List[tuple], inputs: List[tuple], state: List[tuple],
+                  timeout: float = 600) -> dict:
+    """Call a Dash callback through the Flask test ``client`` and return its response.
+
+    ``outputs`` are ``(id, property)`` pairs and ``inputs``/``state``
+    ``(id, property, value)`` triples. Background callbacks are polled until
+    their job has finished, as the browser does.
+    """
+    body = {
+        "output": outputs[0][0] + "." + outputs[0][1] if len(outputs) == 1
+        else ".." + "...".join(f"{i}.{p}" for i, p in outputs) + "..",
+        "outputs": ([{"id": i, "property": p} for i, p in outputs] if len(outputs) > 1
+                    else {"id": outputs[0][0], "property": outputs[0][1]}),
+        "inputs": [{"id": i, "property": p, "value": v} for i, p, v in inputs],
+        "state": [{"id": i, "property": p, "value": v} for i, p, v in state],
+        "changedPropIds": [f"{i}.{p}" for i, p, _ in inputs],
+    }
+    resp = client.post("/_dash-update-component", json=body)
+    job = resp.json if resp.status_code == 200 else None
+    if job and "cacheKey" in job:
+        # Polls answer with progress only until the job has a response
+        deadline = time.monotonic() + timeout
+        while resp.status_code in (200, 204) and "response" not in (resp.json or {}):
+            if time.monotonic() > deadline:
+                raise TimeoutError("Background callback did not finish")
+            time.sleep(0.05)
+            resp = client.post(f"/_dash-update-component?cacheKey={job['cacheKey']}&job={job['job']}",
+                               json=body)
+    if resp.status_code not in (200, 204):
+        raise RuntimeError(f"Callback failed with {resp.status_code}: {resp.get_data(as_text=True)[:300]}")
+    return resp.json or {}
+
+
+def run_cases(years: int, repeat: int) -> Dict[str, float]:
+    """Run every case for one data size and return seconds per case.
+
+    Must run in a fresh process with the stand-in and cache environment set,
+    since the app modules read their configuration on import.
+    """
+    import pandas as pd
+
+    import dmi_cache
+    import functions
+    import pv_model
+    from battery import align_production, interval_hours, simulate_battery
+    from benchmarks.payloads import metering_result
+    from spot_prices import spot_prices_for
+    from tariffs import compile_charges
+    from timeseries_view import build_pyramid, select_view
+
+    date_from = (PERIOD_END - timedelta(days=365 * years)).isoformat()
+    date_to = PERIOD_END.isoformat()
+    results: Dict[str, float] = {}
+
+    def timed(name: str, fn: Callable[[], object], runs: int = 1):
+        results[name] = round(best_of(fn, runs), 6)
+        print(f"  {name:<18} {results[name]:.3f} s", file=sys.stderr)
+
+    # Parsing a gettimeseries response of the whole period in one piece
+    payload = json.dumps({"result": metering_result(
+        [METERING_POINT], date.fromisoformat(date_from), 365 * years)}).encode()
+    timed("parse_json", lambda: functions._data_to_dataframe(json.loads(payload)["result"]), repeat)
+    timed("parse_stream", lambda: functions._columns_to_dataframe(
+        functions._stream_metering_data(BytesIO(payload))[0]), repeat)
+
+    def fetch():
+        return functions.get_metering_dataframe(TOKEN, METERING_POINT, date_from, date_to)
+
+    timed("fetch_cold", fetch)
+    timed("fetch_warm", fetch, repeat)
+    consumption = fetch()[METERING_POINT].dropna()
+    index = consumption.index
+
+    # Compiling and pricing on a fresh schedule, not the cached one
+    charges = functions.get_metering_charges(TOKEN, METERING_POINT)
+    timed("tariffs", lambda: compile_charges(charges).totals(
+        index, consumption=consumption.to_numpy()), repeat)
+    timed("spot_cold", lambda: spot_prices_for(index))
+    timed("spot_warm", lambda: spot_prices_for(index), repeat)
+
+    def pv():
+        return functions.typical_pv_production(ADDRESS, index.min(), index.max(), 6)
+
+    timed("pv_cold", pv)
+    timed("pv_warm", pv, repeat)
+    aligned = align_production(consumption, pv()["P"])
+    timed("battery", lambda: simulate_battery(aligned["consumption"], aligned["production"],
+                                              [0.0, 5.0, 10.0], interval_hours=interval_hours(aligned.index)),
+          repeat)
+    pyramid = build_pyramid(fetch())
+    timed("pyramid", lambda: build_pyramid(consumption.to_frame()), repeat)
+    timed("zoom_view", lambda: select_view(pyramid, index[len(index) // 3], index[len(index) // 2]), repeat)
+
+    # Weather backfill up to the end of the period, compaction and the offline PV model on it
+    dmi_end = PERIOD_END
+    dmi_start = dmi_end - timedelta(days=DMI_DAYS_PER_YEAR * years)
+    dmi_cache.DMI_START_CACHE_DATE = dmi_start.isoformat()
+    timed("dmi_backfill", lambda: dmi_cache.update_dmi_cache(dmi_end))
+    timed("dmi_compact", dmi_cache.compact_weather_cache)
+    lat, lon = functions._geocode_address(ADDRESS)
+    timed("pv_model", lambda: pv_model.simulate_production(
+        lat, lon, 180, 35, 6, pd.Timestamp(dmi_start), pd.Timestamp(dmi_end)), repeat)
+
+    # Callbacks end to end through the Dash endpoint
+    from app import app
+
+    client = app.server.test_client()
+    metering_points = functions.get_metering_points(TOKEN)
+
+    def metering_callback():
+        return dash_callback(
+            client,
+            [("consumption-graph-placeholder", "children"), ("eloverblik_consumption_data", "data"),
+             ("metering_pyramid", "data")],
+            [("eloverblik_selected_metering_point", "data", METERING_POINT)],
+            [("date-picker-range", "start_date", date_from), ("date-picker-range", "end_date", date_to),
+             ("eloverblik_api_key", "data", TOKEN), ("eloverblik_metering_points", "data", metering_points),
+             ("session-id", "data", "bench")],
+        )
+
+    # A background job, including the job process and result store round trip
+    timed("callback_metering", metering_callback, repeat)
+    metering = metering_callback()
+    pyramid_handle = metering["response"]["metering_pyramid"]["data"]
+    consumption_handle = metering["response"]["eloverblik_consumption_data"]["data"]
+    window = {"xaxis.range[0]": str(index[len(index) // 3].tz_convert(None)),
+              "xaxis.range[1]": str(index[len(index) // 2].tz_convert(None))}
+    timed("callback_zoom", lambda: dash_callback(
+        client, [("bar-chart", "figure")],
+        [("metering_pyramid", "data", pyramid_handle), ("bar-chart", "relayoutData", window)], []), repeat)
+    timed("callback_battery", lambda: dash_callback(
+        client, [("battery-result", "children")],
+        [("simulate-battery-button", "n_clicks", 1)],
+        [("pv_configuration", "data", {"pv_size_kw": 6, "orientation": "Syd", "battery_size_kwh": 5}),
+         ("input-address", "value", ADDRESS),
+         ("eloverblik_selected_metering_point", "data", METERING_POINT),
+         ("eloverblik_api_key", "data", TOKEN),
+         ("date-picker-range", "start_date", date_from), ("date-picker-range", "end_date", date_to),
+         ("eloverblik_consumption_data", "data", consumption_handle)]),
+        repeat)
+    return results
+
+
+def run_size(years: int, args: argparse.Namespace, standin_url: str) -> Dict[str, float]:
+    """Run the cases for one size in a subprocess with fresh caches."""
+    from benchmarks.standin import upstream_env
+
+    with tempfile.TemporaryDirectory(prefix="bench-") as tmp:
+        env = dict(os.environ, **upstream_env(standin_url), **NO_RATE_LIMITS)
+        env.update({name: os.path.join(tmp, path) for name, path in CACHE_ENV.items()})
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_suite", "--run-years", str(years),
+             "--repeat", str(args.repeat)],
+            env=env, stdout=subprocess.PIPE, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            tolerance: float, min_delta: float) -> List[str]:
+    """Print results next to the baseline and return the regressed ``size/case`` names."""
+    regressions = []
+    print(f"{'size':>5} {'case':<18} {'baseline [s]':>12} {'now [s]':>9} {'ratio':>6}")
+    for size, cases in results.items():
+        for case, seconds in cases.items():
+            before = baseline.get(size, {}).get(case)
+            if before is None:
+                print(f"{size:>5} {case:<18} {'-':>12} {seconds:>9.3f} {'new':>6}")
+                continue
+            ratio = seconds / before if before else float("inf")
+            regressed = seconds > before * (1 + tolerance) and seconds - before > min_delta
+            flag = "  REGRESSION" if regressed else ""
+            print(f"{size:>5} {case:<18} {before:>12.3f} {seconds:>9.3f} {ratio:>6.2f}{flag}")
+            if regressed:
+                regressions.append(f"{size}/{case}")
+    return regressions
+
+
+def main() -> None:
+    args = parse_args()
+    if args.run_years is not None:
+        print(json.dumps(run_cases(args.run_years, args.repeat)))
+        return
+
+    from benchmarks.standin import start_standin
+
+    server = start_standin(latency=args.latency, resolution=args.resolution)
+    settings = {"latency": args.latency, "resolution": args.resolution, "repeat": args.repeat}
+    results = {}
+    for years in args.years:
+        print(f"Running {years} year(s)...", file=sys.stderr)
+        results[f"{years}y"] = run_size(years, args, server.url)
+    report = {"settings": settings, "results": results, "upstream": server.stats()}
+    server.shutdown()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    baseline: Optional[dict] = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    if baseline is None:
+        compare(results, {}, args.tolerance, args.min_delta)
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one.")
+        return
+    if baseline.get("settings") != settings:
+        print(f"Baseline settings {baseline.get('settings')} differ from {settings}; "
+              "timings may not be comparable.", file=sys.stderr)
+    regressions = compare(results, baseline["results"], args.tolerance, args.min_delta)
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Compare loading a period of DMI weather from daily JSON and from the columnar store.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_weather --days 365
+
+Synthetic day files in the format written by ``dmi_cache`` are generated in
+a temporary directory and compacted with ``weather_store.compact``. The JSON
+path opens and parses every day file into one DataFrame, as a reader of the
+raw cache would; the columnar path calls ``weather_store.load_weather``.
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+from typing import Callable, Dict
+
+import pandas as pd
+
+import weather_store
+from benchmarks.payloads import dmi_day
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--days", type=int, default=365, help="Days of observations.")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Timed runs per reader; the best run is reported.")
+    return parser.parse_args()
+
+
+def load_json_days(day_files: Dict[date, str], start: date, end: date) -> pd.DataFrame:
+    rows = []
+    for day in sorted(day_files):
+        if not start <= day < end:
+            continue
+        with open(day_files[day]) as f:
+            for feature in json.load(f)["features"]:
+                rows.append(feature["properties"])
+    frame = pd.DataFrame(rows)
+    frame["observed"] = pd.to_datetime(frame["observed"], utc=True)
+    return frame
+
+
+def best_of(fn: Callable[[], pd.DataFrame], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - begin)
+    return min(timings)
+
+
+def _size_mb(paths) -> float:
+    return sum(os.path.getsize(p) for p in paths) / 1e6
+
+
+def main() -> None:
+    args = parse_args()
+    start = date(2023, 1, 1)
+    end = start + timedelta(days=args.days)
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_dir = os.path.join(tmp, "dmi")
+        store_dir = os.path.join(tmp, "weather")
+        os.makedirs(raw_dir)
+        day_files = {}
+        for offset in range(args.days):
+            day = start + timedelta(days=offset)
+            day_files[day] = os.path.join(raw_dir, f"{day.isoformat()}.json")
+            with open(day_files[day], "w") as f:
+                json.dump(dmi_day(day), f)
+
+        begin = time.perf_counter()
+        partitions = weather_store.compact(day_files, store_dir)
+        compact_s = time.perf_counter() - begin
+        json_mb = _size_mb(day_files.values())
+        store_mb = _size_mb(os.path.join(store_dir, n) for n in os.listdir(store_dir))
+
+        rows = len(weather_store.load_weather(start, end, store_dir=store_dir))
+        json_s = best_of(lambda: load_json_days(day_files, start, end), args.repeat)
+        store_s = best_of(lambda: weather_store.load_weather(start, end, store_dir=store_dir),
+                          args.repeat)
+        subset_s = best_of(lambda: weather_store.load_weather(
+            start, end, stations=["06180"], parameters=["radia_glob"], store_dir=store_dir),
+            args.repeat)
+
+    print(f"{rows} observations over {args.days} days, {partitions} partitions "
+          f"compacted in {compact_s:.2f} s")
+    print(f"{'reader':>22} {'size [MB]':>10} {'load [s]':>9}")
+    print(f"{'json day files':>22} {json_mb:>10.1f} {json_s:>9.3f}")
+    print(f"{'columnar store':>22} {store_mb:>10.1f} {store_s:>9.3f}")
+    print(f"{'store, 1 stn/param':>22} {'':>10} {subset_s:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Synthetic upstream payloads for the benchmarks.
+
+The generators mimic the structure of the real Eloverblik responses closely
+enough for the parsers to exercise the same code paths (per-day periods,
+DST days with 23/25 hours, string quantities).
+"""
+
+import zlib
+from datetime import date, timedelta
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+LOCAL_TZ = "Europe/Copenhagen"
+RESOLUTION_MINUTES = {"PT15M": 15, "PT1H": 60}
+
+
+def _iso(ts: pd.Timestamp) -> str:
+    return ts.tz_convert("UTC").strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def metering_timeseries(
+    metering_point_id: str,
+    start: date,
+    days: int,
+    resolution: str = "PT1H",
+    seed: int = 0,
+) -> Dict:
+    """Return one ``TimeSeries`` entry with ``days`` daily periods."""
+    rng = np.random.default_rng(seed)
+    minutes = RESOLUTION_MINUTES[resolution]
+    periods = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        day_start = pd.Timestamp(day).tz_localize(LOCAL_TZ)
+        day_end = pd.Timestamp(day + timedelta(days=1)).tz_localize(LOCAL_TZ)
+        n_points = int((day_end - day_start) / pd.Timedelta(minutes=minutes))
+        quantities = rng.gamma(2.0, 0.25 * minutes / 60, n_points)
+        periods.append({
+            "resolution": resolution,
+            "timeInterval": {"start": _iso(day_start), "end": _iso(day_end)},
+            "Point": [
+                {
+                    "position": str(position + 1),
+                    "out_Quantity.quantity": f"{quantity:.3f}",
+                    "out_Quantity.quality": "A04",
+                }
+                for position, quantity in enumerate(quantities)
+            ],
+        })
+    return {
+        "mRID": metering_point_id,
+        "businessType": "A04",
+        "curveType": "A01",
+        "measurement_Unit.name": "KWH",
+        "MarketEvaluationPoint": {
+            "mRID": {"codingScheme": "A10", "name": metering_point_id}
+        },
+        "Period": periods,
+    }
+
+
+def metering_result(
+    metering_point_ids: List[str],
+    start: date,
+    days: int,
+    resolution: str = "PT1H",
+) -> List[Dict]:
+    """Return a ``result`` list as returned by ``gettimeseries``."""
+    return [
+        {
+            "MyEnergyData_MarketDocument": {
+                "mRID": f"doc-{mp}",
+                "createdDateTime": "2024-01-01T00:00:00Z",
+                "TimeSeries": [
+                    metering_timeseries(mp, start, days, resolution, seed=i)
+                ],
+            },
+            "success": True,
+            "errorCode": 10000,
+            "errorText": "NoError",
+            "id": mp,
+        }
+        for i, mp in enumerate(metering_point_ids)
+    ]
+
+
+# Station coordinates (lon, lat) used for synthetic DMI observations
+DMI_STATIONS = {
+    "06180": (12.6560, 55.6139),
+    "06060": (9.1149, 56.2935),
+    "06030": (9.8492, 57.0963),
+    "06120": (10.3304, 55.4748),
+    "06080": (8.5534, 55.5281),
+}
+DMI_PARAMETERS = ("radia_glob", "temp_dry", "cloud_cover")
+
+
+def dmi_day(day: date, stations=DMI_STATIONS, parameters=DMI_PARAMETERS,
+            interval_minutes: int = 10, seed: int = 0) -> Dict:
+    """Return one cached DMI day file (trimmed features) as written by ``dmi_cache``."""
+    rng = np.random.default_rng(seed + day.toordinal())
+    times = pd.date_range(pd.Timestamp(day), periods=24 * 60 // interval_minutes,
+                          freq=f"{interval_minutes}min")
+    observed = [t.strftime("%Y-%m-%dT%H:%M:%SZ") for t in times]
+    features = []
+    for station in stations:
+        lon, lat = stations[station]
+        for parameter in parameters:
+            for when, value in zip(observed, rng.normal(10, 5, len(observed)).round(1)):
+                features.append({
+                    "type": "Feature",
+                    "geometry": {"type": "Point", "coordinates": [lon, lat]},
+                    "properties": {
+                        "stationId": station,
+                        "parameterId": parameter,
+                        "observed": when,
+                        "value": float(value),
+                    },
+                })
+    return {"type": "FeatureCollection", "features": features}
+
+
+def _diurnal(times: pd.DatetimeIndex, peak: float) -> np.ndarray:
+    """Return a clear-sky-like daily curve (0 at night) peaking at ``peak`` around 12 UTC in summer."""
+    hour = times.hour.to_numpy() + times.minute.to_numpy() / 60
+    season = 0.55 + 0.45 * np.cos((times.dayofyear.to_numpy() - 172) / 365.25 * 2 * np.pi)
+    return np.clip(np.sin((hour - 4) / 16 * np.pi), 0, None) * peak * season
+
+
+def dmi_observations(station: str, parameter: str, start: pd.Timestamp, end: pd.Timestamp,
+                     interval_minutes: int = 10) -> List[Dict]:
+    """Return metObs features of one station and parameter for ``start <= observed <= end`` (UTC)."""
+    times = pd.date_range(start.ceil(f"{interval_minutes}min"), end, freq=f"{interval_minutes}min")
+    rng = np.random.default_rng(zlib.crc32(f"{station}:{parameter}".encode()) + start.toordinal())
+    if parameter == "radia_glob":
+        values = _diurnal(times, 850) * rng.uniform(0.3, 1.0, len(times))
+    elif parameter == "cloud_cover":
+        values = rng.uniform(0, 100, len(times))
+    else:
+        values = 8 + 0.01 * _diurnal(times, 850) + rng.normal(0, 2, len(times))
+    lon, lat = DMI_STATIONS.get(station, (10.0, 56.0))
+    return [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [lon, lat]},
+            "id": f"{station}-{parameter}-{when}",
+            "properties": {
+                "stationId": station,
+                "parameterId": parameter,
+                "observed": when,
+                "value": round(float(value), 1),
+                "created": when,
+            },
+        }
+        for when, value in zip(times.strftime("%Y-%m-%dT%H:%M:%SZ"), values)
+    ]
+
+
+def pvgis_hourly(first_year: int, last_year: int, angle: float = 35, aspect: float = 0) -> Dict:
+    """Return a ``seriescalc`` response of a 1 kWp system with hourly ``P`` (W)."""
+    times = pd.date_range(f"{first_year}-01-01 00:10", f"{last_year}-12-31 23:10", freq="h")
+    factor = np.cos(np.radians(aspect)) * 0.15 + 0.85 - abs(angle - 35) / 200
+    power = _diurnal(times, 1000 * factor)
+    return {
+        "inputs": {"pv_module": {"peak_power": 1}},
+        "outputs": {
+            "hourly": [
+                {"time": when, "P": round(float(value), 2), "G(i)": 0.0, "T2m": 10.0}
+                for when, value in zip(times.strftime("%Y%m%d:%H%M"), power)
+            ]
+        },
+    }
+
+
+def charges_result(metering_point_id: str) -> List[Dict]:
+    """Return a ``getcharges`` result list with hourly and daily tariffs, a subscription and no fees."""
+    hourly = [0.15] * 6 + [0.45] * 11 + [1.35] * 4 + [0.45] * 3
+    return [{
+        "result": {
+            "meteringPointId": metering_point_id,
+            "tariffs": [
+                {"name": "Nettarif C time", "periodType": "PT1H", "validFromDate": "2015-01-01T00:00:00+01:00",
+                 "validToDate": None,
+                 "prices": [{"position": str(i + 1), "price": price} for i, price in enumerate(hourly)]},
+                {"name": "Elafgift", "periodType": "P1D", "validFromDate": "2015-01-01T00:00:00+01:00",
+                 "validToDate": None, "prices": [{"position": "1", "price": 0.761}]},
+            ],
+            "subscriptions": [{"name": "Netabonnement", "price": 21.0, "quantity": 1}],
+            "fees": [],
+        },
+        "success": True,
+        "errorCode": 10000,
+        "errorText": "NoError",
+        "id": metering_point_id,
+    }]
+
+
+def spot_records(area: str, start: date, end: date, dataset: str = "DayAheadPrices") -> List[Dict]:
+    """Return spot price records (DKK/MWh) for ``[start, end)`` in UTC.
+
+    ``Elspotprices`` has hourly records up to 2025-09-30 (Danish time),
+    ``DayAheadPrices`` 15-minute records from then on.
+    """
+    switch = pd.Timestamp("2025-09-30T22:00")
+    hourly = dataset == "Elspotprices"
+    times = pd.date_range(pd.Timestamp(start), pd.Timestamp(end), freq="h" if hourly else "15min",
+                          inclusive="left")
+    times = times[times < switch] if hourly else times[times >= switch]
+    rng = np.random.default_rng(start.toordinal())
+    hours = times.hour.to_numpy() + times.minute.to_numpy() / 60
+    prices = 600 + 300 * np.sin((hours - 7) / 24 * 2 * np.pi) + rng.normal(0, 80, len(times))
+    time_field, value_field = ("HourUTC", "SpotPriceDKK") if hourly else ("TimeUTC", "DayAheadPriceDKK")
+    return [
+        {time_field: when, "PriceArea": area, value_field: round(float(price), 2)}
+        for when, price in zip(times.strftime("%Y-%m-%dT%H:%M:%S"), prices)
+    ]
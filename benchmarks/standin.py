@@ -0,0 +1,233 @@
+"""
+Local HTTP stand-in for the upstream services used by the app.
+
+Run from the repository root:
+
+    python -m benchmarks.standin --port 8765 --latency 0.05
+
+Synthetic payloads from :mod:`benchmarks.payloads` are served under one
+prefix per upstream:
+
+    /eloverblik   token, meteringpoints, gettimeseries and getcharges
+    /pvgis        seriescalc
+    /nominatim    search
+    /dmi          metObs observation items, paginated with ``next`` links
+    /spot         Elspotprices and DayAheadPrices records, e.g. /spot/DayAheadPrices
+    /_stats       requests and bytes served per upstream
+
+Point the app at it with the variables printed on start-up (see
+:func:`upstream_env`). Every response is delayed by ``--latency`` seconds;
+``--resolution`` and ``--dmi-interval`` set the size of metering and
+weather payloads.
+"""
+
+import argparse
+import base64
+import json
+import sys
+import time
+import zlib
+from collections import Counter
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import pandas as pd
+
+from benchmarks.payloads import (DMI_STATIONS, charges_result, dmi_observations, metering_result,
+                                 pvgis_hourly, spot_records)
+
+# Eloverblik aggregations the stand-in can answer, with the resolution served
+AGGREGATION_RESOLUTIONS = {"Quarter": "PT15M", "Hour": "PT1H"}
+
+
+def _token() -> str:
+    payload = base64.urlsafe_b64encode(json.dumps({"exp": time.time() + 86400}).encode())
+    return "standin." + payload.decode().rstrip("=") + ".signature"
+
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], latency: float = 0.0,
+                 resolution: str = "PT1H", dmi_interval: int = 10):
+        super().__init__(address, StandinHandler)
+        self.latency = latency
+        self.resolution = resolution
+        self.dmi_interval = dmi_interval
+        self.requests: Counter = Counter()
+        self.bytes: Counter = Counter()
+        self._stats_lock = Lock()
+        # PVGIS profiles are large and requested with few distinct parameters
+        self._pvgis: Dict[tuple, bytes] = {}
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, upstream: str, size: int) -> None:
+        with self._stats_lock:
+            self.requests[upstream] += 1
+            self.bytes[upstream] += size
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._stats_lock:
+            return {name: {"requests": self.requests[name], "bytes": self.bytes[name]}
+                    for name in self.requests}
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    server: StandinServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def _send(self, upstream: str, body, status: int = 200) -> None:
+        data = body if isinstance(body, bytes) else json.dumps(body).encode()
+        if upstream != "_stats":
+            time.sleep(self.server.latency)
+            self.server.count(upstream, len(data))
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _route(self, method: str) -> None:
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        upstream, _, rest = url.path.strip("/").partition("/")
+        if upstream == "_stats":
+            self._send(upstream, self.server.stats())
+            return
+        body = None
+        if method == "POST":
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"null")
+        handler = getattr(self, f"_{upstream}", None)
+        if handler is None:
+            self._send(upstream or "unknown", {"error": "not found"}, 404)
+            return
+        try:
+            handler(rest, query, body)
+        except (KeyError, ValueError) as exc:
+            self._send(upstream, {"error": str(exc)}, 400)
+
+    def do_GET(self) -> None:
+        self._route("GET")
+
+    def do_POST(self) -> None:
+        self._route("POST")
+
+    def _eloverblik(self, path: str, query: dict, body: Optional[dict]) -> None:
+        if path == "token":
+            self._send("eloverblik", {"result": _token()})
+        elif path == "meteringpoints/meteringpoints":
+            self._send("eloverblik", {"result": [
+                {"meteringPointId": "571313100000000001", "typeOfMP": "E17", "streetName": "Standinvej",
+                 "buildingNumber": "1", "postcode": "8000", "cityName": "Aarhus C"},
+                {"meteringPointId": "571313100000000002", "typeOfMP": "E18", "streetName": "Standinvej",
+                 "buildingNumber": "1", "postcode": "8000", "cityName": "Aarhus C"},
+            ]})
+        elif path.startswith("meterdata/gettimeseries/"):
+            date_from, date_to, aggregation = path.split("/")[2:5]
+            resolution = self.server.resolution if aggregation == "Actual" else AGGREGATION_RESOLUTIONS[aggregation]
+            start, end = date.fromisoformat(date_from), date.fromisoformat(date_to)
+            metering_points = body["meteringPoints"]["meteringPoint"]
+            self._send("eloverblik", {"result": metering_result(
+                metering_points, start, (end - start).days, resolution)})
+        elif path == "meteringpoints/meteringpoint/getcharges":
+            metering_point = body["meteringPoints"]["meteringPoint"][0]
+            self._send("eloverblik", {"result": charges_result(metering_point)})
+        else:
+            self._send("eloverblik", {"error": "not found"}, 404)
+
+    def _pvgis(self, path: str, query: dict, body) -> None:
+        key = (int(query["startyear"]), int(query["endyear"]),
+               float(query.get("angle", 35)), float(query.get("aspect", 0)))
+        data = self.server._pvgis.get(key)
+        if data is None:
+            data = self.server._pvgis[key] = json.dumps(pvgis_hourly(*key)).encode()
+        self._send("pvgis", data)
+
+    def _nominatim(self, path: str, query: dict, body) -> None:
+        # Deterministic coordinates in Denmark for any address
+        seed = zlib.crc32(query["q"].encode())
+        lat, lon = 54.8 + (seed % 2000) / 1000, 8.3 + (seed // 2000 % 4300) / 1000
+        self._send("nominatim", [{
+            "place_id": seed, "lat": f"{lat:.6f}", "lon": f"{lon:.6f}",
+            "display_name": query["q"], "boundingbox": [str(lat), str(lat), str(lon), str(lon)],
+        }])
+
+    def _dmi(self, path: str, query: dict, body) -> None:
+        start, end = (pd.Timestamp(t).tz_convert(None) for t in query["datetime"].split("/"))
+        stations = [query["stationId"]] if "stationId" in query else list(DMI_STATIONS)
+        parameters = [query["parameterId"]] if "parameterId" in query else ["radia_glob", "temp_dry"]
+        features = [feature for station in stations for parameter in parameters
+                    for feature in dmi_observations(station, parameter, start, end, self.server.dmi_interval)]
+        offset, limit = int(query.get("offset", 0)), int(query.get("limit", 1000))
+        page = features[offset:offset + limit]
+        links = []
+        if offset + limit < len(features):
+            following = dict(query, offset=offset + limit)
+            links.append({"rel": "next", "href": f"{self.server.url}/dmi?{urlencode(following)}"})
+        self._send("dmi", {"type": "FeatureCollection", "features": page,
+                           "numberReturned": len(page), "links": links})
+
+    def _spot(self, path: str, query: dict, body) -> None:
+        area = json.loads(query.get("filter", "{}")).get("PriceArea", ["DK1"])[0]
+        start, end = date.fromisoformat(query["start"][:10]), date.fromisoformat(query["end"][:10])
+        self._send("spot", {"total": 0, "records": spot_records(area, start, end, path or "DayAheadPrices")})
+
+
+def upstream_env(url: str) -> Dict[str, str]:
+    """Return the environment pointing every upstream of the app at the stand-in at ``url``."""
+    scheme, _, host = url.partition("://")
+    return {
+        "ELOVERBLIK_API_URL": f"{url}/eloverblik",
+        "PVGIS_API_URL": f"{url}/pvgis",
+        "NOMINATIM_SCHEME": scheme,
+        "NOMINATIM_DOMAIN": f"{host}/nominatim",
+        "DMI_API_URL": f"{url}/dmi",
+        "DMI_API_KEY": "standin",
+        "SPOT_PRICE_API_URL": f"{url}/spot/DayAheadPrices",
+        "SPOT_PRICE_HISTORY_API_URL": f"{url}/spot/Elspotprices",
+    }
+
+
+def start_standin(port: int = 0, latency: float = 0.0, resolution: str = "PT1H",
+                  dmi_interval: int = 10) -> StandinServer:
+    """Start a stand-in on ``127.0.0.1`` in a daemon thread and return it."""
+    server = StandinServer(("127.0.0.1", port), latency, resolution, dmi_interval)
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on (0 picks a free one).")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response.")
+    parser.add_argument("--resolution", default="PT1H", choices=["PT15M", "PT1H"],
+                        help="Resolution of metering data for the 'Actual' aggregation.")
+    parser.add_argument("--dmi-interval", type=int, default=10, help="Minutes between DMI observations.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    server = StandinServer(("127.0.0.1", args.port), args.latency, args.resolution, args.dmi_interval)
+    for name, value in upstream_env(server.url).items():
+        print(f"{name}={value}")
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+FETCH_WORKERS = int(os.environ.get("FETCH_WORKERS", "4"))
+FETCH_RETRIES = int(os.environ.get("FETCH_RETRIES", "2"))
+FETCH_BACKOFF = float(os.environ.get("FETCH_BACKOFF", "1.0"))
+
+Window = Tuple[date, date]
+Progress = Callable[[int, int, int], None]
+
+
+@dataclass
+class WindowResult:
+    start: date
+    end: date
+    key: Any = None
+    result: Any = None
+    error: Optional[BaseException] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def month_windows(date_from: date, date_to: date, months: int = 1) -> List[Window]:
+    """Split ``[date_from, date_to)`` into windows on calendar month boundaries."""
+    windows = []
+    start = date_from
+    while start < date_to:
+        month = start.month - 1 + months
+        end = min(date(start.year + month // 12, month % 12 + 1, 1), date_to)
+        windows.append((start, end))
+        start = end
+    return windows
+
+
+def _with_retry(fetch: Callable[..., Any], args: tuple,
+                retries: int, backoff: float) -> Any:
+    attempt = 0
+    while True:
+        try:
+            return fetch(*args)
+        except Exception:
+            if attempt >= retries:
+                raise
+            time.sleep(backoff * 2 ** attempt)
+            attempt += 1
+
+
+def fetch_windows(
+    windows: List[Window],
+    fetch: Callable[..., Any],
+    keys: Optional[Sequence[Any]] = None,
+    max_workers: int = FETCH_WORKERS,
+    retries: int = FETCH_RETRIES,
+    backoff: float = FETCH_BACKOFF,
+    progress: Optional[Progress] = None,
+) -> List[WindowResult]:
+    """Call ``fetch(start, end)`` for every window on a bounded thread pool.
+
+    When ``keys`` is given it must match ``windows`` one to one, and
+    ``fetch(start, end, key)`` is called instead; the key is kept on the
+    result so the same window can be fetched for several keys.
+
+    Each window is retried with exponential backoff. A window that still
+    fails is returned with its ``error`` set instead of aborting the others,
+    so callers can use partial results. ``progress(done, total, failed)`` is
+    called after every finished window. Results are returned in window order.
+    """
+    if keys is None:
+        results = [WindowResult(start, end) for start, end in windows]
+    else:
+        results = [WindowResult(start, end, key) for (start, end), key in zip(windows, keys)]
+    if not windows:
+        return results
+
+    done = failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(windows)))) as pool:
+        futures = {
+            pool.submit(
+                _with_retry, fetch,
+                (r.start, r.end) if keys is None else (r.start, r.end, r.key),
+                retries, backoff,
+            ): i
+            for i, r in enumerate(results)
+        }
+        for future in as_completed(futures):
+            item = results[futures[future]]
+            try:
+                item.result = future.result()
+            except Exception as exc:
+                item.error = exc
+            done += 1
+            failed += item.error is not None
+            if progress is not None:
+                progress(done, len(windows), failed)
+    return results
@@ -0,0 +1,35 @@
+import os
+import tempfile
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+
+def save_columns(path: str, columns: Dict[str, np.ndarray]) -> None:
+    """Write ``columns`` to a compressed ``.npz`` file atomically.
+
+    The data is written to a temporary file in the same directory and then
+    renamed over ``path``, so concurrent readers see either the old or the
+    new file, never a partial one.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez_compressed(f, **columns)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def load_columns(path: str, names: Optional[Iterable[str]] = None) -> Dict[str, np.ndarray]:
+    """Read columns from a file written by :func:`save_columns`.
+
+    Only the requested ``names`` are decompressed; all columns are read when
+    ``names`` is ``None``.
+    """
+    with np.load(path, allow_pickle=False) as f:
+        return {name: f[name] for name in (f.files if names is None else names)}
@@ -1,16 +1,287 @@
 import os
 import json
 import time
+import hashlib
+import tempfile
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
 from datetime import datetime, timedelta
-from threading import Thread
-from typing import Optional, Tuple
+from threading import Lock, Thread
+from typing import Dict, List, Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
+
+import weather_store
+from process_lock import hold_lock
+from ratelimit import RateLimiter
 
 DMI_CACHE_DIR = os.environ.get("DMI_CACHE_DIR", "dmi_cache")
 DMI_START_CACHE_DATE = os.environ.get("DMI_START_CACHE_DATE")
 DMI_API_URL = os.environ.get("DMI_API_URL", "https://dmigw.govcloud.dk/v2/metObs/collections/observation/items")
 DMI_API_KEY = os.environ.get("DMI_API_KEY")
+DMI_FETCH_WORKERS = int(os.environ.get("DMI_FETCH_WORKERS", "4"))
+DMI_REQUESTS_PER_SECOND = float(os.environ.get("DMI_REQUESTS_PER_SECOND", "5"))
+DMI_RETRIES = int(os.environ.get("DMI_RETRIES", "3"))
+DMI_BACKOFF = float(os.environ.get("DMI_BACKOFF", "2"))
+# Every feature of a span is held in memory until its days are written, and a
+# failed query marks the whole span failed, so spans are kept to about a month.
+DMI_FETCH_SPAN_DAYS = int(os.environ.get("DMI_FETCH_SPAN_DAYS", "31"))
+DMI_PAGE_LIMIT = int(os.environ.get("DMI_PAGE_LIMIT", "100000"))
+# Stations near our customers: København Lufthavn, Karup, Aalborg, Odense, Esbjerg.
+# Set DMI_STATION_IDS to an empty string to fetch all stations (optionally within DMI_BBOX).
+DMI_STATION_IDS = [s for s in os.environ.get(
+    "DMI_STATION_IDS", "06180,06060,06030,06120,06080").split(",") if s]
+DMI_BBOX = os.environ.get("DMI_BBOX")
+# Irradiance, temperature and cloud cover used for PV modelling
+DMI_PARAMETER_IDS = [p for p in os.environ.get(
+    "DMI_PARAMETER_IDS", "radia_glob,temp_dry,cloud_cover").split(",") if p]
+
+DMI_MANIFEST_NAME = "manifest.json"
+# Backfill counters of the cache worker, readable by every server process
+DMI_PROGRESS_NAME = "progress.json"
+DMI_WORKER_LOCK = os.path.join(DMI_CACHE_DIR, "worker.lock")
+
+_KEPT_PROPERTIES = ("stationId", "parameterId", "observed", "value")
+
+
+@dataclass
+class BackfillProgress:
+    """Counters of the running (or last) cache update."""
+
+    total: int = 0
+    done: int = 0
+    cached: int = 0
+    failed: int = 0
+    running: bool = False
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+
+_progress = BackfillProgress()
+_progress_lock = Lock()
+_session: Optional[requests.Session] = None
+_limiter = RateLimiter(DMI_REQUESTS_PER_SECOND)
+
+
+def get_backfill_progress() -> Dict:
+    """Return the DMI backfill progress counters written by the cache worker.
+
+    Only one process runs the backfill, so the counters are read from
+    ``progress.json`` in the cache directory rather than from memory.
+    """
+    try:
+        with open(os.path.join(DMI_CACHE_DIR, DMI_PROGRESS_NAME)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return asdict(BackfillProgress())
+
+
+def _save_progress() -> None:
+    # Called with _progress_lock held, so the file follows the counters in order
+    _atomic_write_json(os.path.join(DMI_CACHE_DIR, DMI_PROGRESS_NAME), asdict(_progress))
+
+
+def _get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(DMI_FETCH_WORKERS, 1))
+        _session = requests.Session()
+        _session.mount("https://", adapter)
+        _session.mount("http://", adapter)
+    return _session
+
+
+class DMIManifest:
+    """Index of the cached days: ``day -> status, size, sha256, fetched_at``.
+
+    The manifest lives next to the day files and is updated by the cache
+    worker as days are written. Contiguous runs of ``ok`` days are kept as
+    sorted start/end lists, so membership, gap and range queries are binary
+    searches instead of directory scans. Readers reload the file when its
+    modification time changes.
+    """
+
+    def __init__(self, cache_dir: str = DMI_CACHE_DIR):
+        self.path = os.path.join(cache_dir, DMI_MANIFEST_NAME)
+        self.cache_dir = cache_dir
+        self._lock = Lock()
+        self._days: Dict[str, dict] = {}
+        self._starts: List[int] = []
+        self._ends: List[int] = []
+        self._longest: Optional[Tuple[int, int]] = None
+        self._mtime: Optional[int] = None
+
+    def _add_ok(self, ordinal: int) -> None:
+        i = bisect_right(self._starts, ordinal) - 1
+        if i >= 0 and self._ends[i] >= ordinal:
+            return
+        join_left = i >= 0 and self._ends[i] == ordinal - 1
+        join_right = i + 1 < len(self._starts) and self._starts[i + 1] == ordinal + 1
+        if join_left and join_right:
+            self._ends[i] = self._ends.pop(i + 1)
+            self._starts.pop(i + 1)
+        elif join_left:
+            self._ends[i] = ordinal
+        elif join_right:
+            self._starts[i + 1] = ordinal
+        else:
+            self._starts.insert(i + 1, ordinal)
+            self._ends.insert(i + 1, ordinal)
+        self._longest = None
+
+    def _remove_ok(self, ordinal: int) -> None:
+        i = bisect_right(self._starts, ordinal) - 1
+        if i < 0 or self._ends[i] < ordinal:
+            return
+        start, end = self._starts[i], self._ends[i]
+        del self._starts[i], self._ends[i]
+        if ordinal < end:
+            self._starts.insert(i, ordinal + 1)
+            self._ends.insert(i, end)
+        if start < ordinal:
+            self._starts.insert(i, start)
+            self._ends.insert(i, ordinal - 1)
+        self._longest = None
+
+    def _set(self, day: str, entry: dict) -> None:
+        self._days[day] = entry
+        ordinal = datetime.fromisoformat(day).toordinal()
+        if entry["status"] == "ok":
+            self._add_ok(ordinal)
+        else:
+            self._remove_ok(ordinal)
+
+    def _rebuild(self, days: Dict[str, dict]) -> None:
+        self._days, self._starts, self._ends, self._longest = {}, [], [], None
+        for day in sorted(days):
+            self._set(day, days[day])
+
+    def _scan_directory(self) -> Dict[str, dict]:
+        """Build entries from existing day files (caches written before the manifest)."""
+        days = {}
+        if not os.path.isdir(self.cache_dir):
+            return days
+        for name in os.listdir(self.cache_dir):
+            day, ext = os.path.splitext(name)
+            if ext != ".json" or name == DMI_MANIFEST_NAME:
+                continue
+            try:
+                datetime.strptime(day, "%Y-%m-%d")
+            except ValueError:
+                continue
+            path = os.path.join(self.cache_dir, name)
+            with open(path, "rb") as f:
+                content = f.read()
+            days[day] = {
+                "status": "ok",
+                "size": len(content),
+                "sha256": hashlib.sha256(content).hexdigest(),
+                "fetched_at": os.path.getmtime(path),
+            }
+        return days
+
+    def refresh(self) -> None:
+        """Load the manifest if it changed on disk since the last load."""
+        with self._lock:
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except FileNotFoundError:
+                if self._mtime is None:
+                    days = self._scan_directory()
+                    self._rebuild(days)
+                    self._mtime = -1
+                    if days:
+                        self._save()
+                return
+            if mtime == self._mtime:
+                return
+            with open(self.path) as f:
+                self._rebuild(json.load(f).get("days", {}))
+            self._mtime = mtime
+
+    def _save(self) -> None:
+        _atomic_write_json(self.path, {"version": 1, "days": self._days})
+        self._mtime = os.stat(self.path).st_mtime_ns
+
+    def record(self, entries: Dict[str, dict]) -> None:
+        """Add or replace entries and persist the manifest."""
+        self.refresh()
+        with self._lock:
+            for day in sorted(entries):
+                self._set(day, entries[day])
+            self._save()
+
+    def is_cached(self, date) -> bool:
+        self.refresh()
+        ordinal = date.toordinal()
+        with self._lock:
+            i = bisect_right(self._starts, ordinal) - 1
+            return i >= 0 and self._ends[i] >= ordinal
+
+    def gaps(self, start, end) -> List:
+        """Return the days in ``[start, end]`` that are not cached with status ``ok``."""
+        self.refresh()
+        first, last = start.toordinal(), end.toordinal()
+        missing = []
+        current = first
+        with self._lock:
+            i = max(bisect_right(self._starts, first) - 1, 0)
+            while current <= last:
+                if i < len(self._starts) and self._ends[i] < current:
+                    i += 1
+                    continue
+                if i < len(self._starts) and self._starts[i] <= current:
+                    current = self._ends[i] + 1
+                    i += 1
+                    continue
+                stop = min(last + 1, self._starts[i]) if i < len(self._starts) else last + 1
+                missing.extend(datetime.fromordinal(o).date() for o in range(current, stop))
+                current = stop
+        return missing
+
+    def ok_days(self) -> List:
+        """Return the sorted days cached with status ``ok``."""
+        self.refresh()
+        with self._lock:
+            ranges = list(zip(self._starts, self._ends))
+        return [datetime.fromordinal(o).date() for start, end in ranges for o in range(start, end + 1)]
+
+    def longest_range(self):
+        self.refresh()
+        with self._lock:
+            if not self._starts:
+                return None
+            if self._longest is None:
+                self._longest = max(zip(self._starts, self._ends), key=lambda r: r[1] - r[0])
+            start, end = self._longest
+        return datetime.fromordinal(start).date(), datetime.fromordinal(end).date()
+
+
+_manifest: Optional[DMIManifest] = None
+
+
+def get_manifest() -> DMIManifest:
+    global _manifest
+    if _manifest is None:
+        _manifest = DMIManifest()
+    return _manifest
+
+
+def _atomic_write_json(path: str, data) -> bytes:
+    """Write ``data`` as JSON via a temp file and rename; return the bytes written."""
+    content = json.dumps(data).encode()
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return content
 
 
 def _ensure_cache_dir() -> None:
@@ -22,53 +293,177 @@ def _cache_file_path(date: datetime) -> str:
 
 
 def _is_day_cached(date: datetime) -> bool:
-    return os.path.exists(_cache_file_path(date))
+    return get_manifest().is_cached(date)
+
+
+def _get_with_retry(url: str, params: Optional[Dict]) -> dict:
+    for attempt in range(DMI_RETRIES + 1):
+        try:
+            _limiter.wait()
+            resp = _get_session().get(url, params=params, timeout=60)
+            resp.raise_for_status()
+            return resp.json()
+        except Exception:
+            if attempt >= DMI_RETRIES:
+                raise
+            time.sleep(DMI_BACKOFF * 2 ** attempt)
+
+
+def _fetch_pages(params: Dict) -> List[dict]:
+    """Return the features of a query, following ``next`` links to the end."""
+    features = []
+    url, query = DMI_API_URL, params
+    while url:
+        data = _get_with_retry(url, query)
+        features.extend(data.get("features", []))
+        url = next((link["href"] for link in data.get("links", [])
+                    if link.get("rel") == "next"), None)
+        # The next link carries the query; only the key may need re-adding
+        query = {"api-key": DMI_API_KEY} if url and DMI_API_KEY and "api-key" not in url else None
+    return features
 
 
-def _fetch_dmi_day(date: datetime) -> Optional[dict]:
-    params = {
-        "datetime": date.strftime("%Y-%m-%dT00:00:00Z"),
-        "api-key": DMI_API_KEY,
+def _trim_feature(feature: dict) -> dict:
+    properties = feature.get("properties", {})
+    return {
+        "type": "Feature",
+        "geometry": feature.get("geometry"),
+        "properties": {key: properties.get(key) for key in _KEPT_PROPERTIES},
     }
+
+
+def _fetch_dmi_span(start, end) -> Optional[Dict[str, List[dict]]]:
+    """Fetch observations for the days ``[start, end)`` split per day.
+
+    One paginated query is made per configured station and parameter (or
+    one per parameter when no stations are configured). Returns a mapping
+    of ``YYYY-MM-DD`` to trimmed features, with every day of the span
+    present, or ``None`` if any query failed.
+    """
+    interval = f"{start.isoformat()}T00:00:00Z/{(end - timedelta(days=1)).isoformat()}T23:59:59Z"
+    base = {"datetime": interval, "limit": DMI_PAGE_LIMIT, "api-key": DMI_API_KEY}
+    if DMI_BBOX:
+        base["bbox"] = DMI_BBOX
+
+    days = {}
+    current = start
+    while current < end:
+        days[current.isoformat()] = []
+        current += timedelta(days=1)
+
+    print(f"Fetching weather data for {start} - {end - timedelta(days=1)} from DMI")
     try:
-        print(f"Fetching weather data for {date.date()} from DMI")
-        resp = requests.get(DMI_API_URL, params=params, timeout=30)
-        resp.raise_for_status()
-        return resp.json()
+        for station in DMI_STATION_IDS or [None]:
+            for parameter in DMI_PARAMETER_IDS or [None]:
+                params = dict(base)
+                if station:
+                    params["stationId"] = station
+                if parameter:
+                    params["parameterId"] = parameter
+                for feature in _fetch_pages(params):
+                    observed = feature.get("properties", {}).get("observed", "")
+                    if observed[:10] in days:
+                        days[observed[:10]].append(_trim_feature(feature))
     except Exception:
-        print(f"Failed fetching DMI data for {date.date()}")
+        print(f"Failed fetching DMI data for {start} - {end - timedelta(days=1)}")
         return None
+    return days
 
 
-def _save_day_cache(date: datetime, data: dict) -> None:
-    path = _cache_file_path(date)
-    with open(path, "w") as f:
-        json.dump(data, f)
+def _save_day_cache(date: datetime, data: dict) -> dict:
+    """Write a day file atomically and return its manifest entry."""
+    content = _atomic_write_json(_cache_file_path(date), data)
+    return {
+        "status": "ok" if date < datetime.utcnow().date() else "partial",
+        "size": len(content),
+        "sha256": hashlib.sha256(content).hexdigest(),
+        "fetched_at": time.time(),
+    }
+
 
+def _update_span(span) -> None:
+    start, end = span
+    days = _fetch_dmi_span(start, end)
+    entries = {}
+    if days is not None:
+        print(f"Caching DMI data for {start} - {end - timedelta(days=1)}")
+        for day, features in days.items():
+            entries[day] = _save_day_cache(datetime.fromisoformat(day).date(),
+                                           {"type": "FeatureCollection", "features": features})
+    else:
+        current = start
+        while current < end:
+            entries[current.isoformat()] = {"status": "failed", "size": 0, "sha256": None,
+                                            "fetched_at": time.time()}
+            current += timedelta(days=1)
+    get_manifest().record(entries)
+    with _progress_lock:
+        _progress.done += (end - start).days
+        if days is None:
+            _progress.failed += (end - start).days
+        else:
+            _progress.cached += (end - start).days
+        _save_progress()
 
-def update_dmi_cache() -> None:
-    """Ensure cache exists from DMI_START_CACHE_DATE to today."""
+
+def _missing_spans(missing: List) -> List[Tuple]:
+    """Group sorted missing days into ``[start, end)`` spans of at most ``DMI_FETCH_SPAN_DAYS``."""
+    spans = []
+    for day in missing:
+        if spans and spans[-1][1] == day and (day - spans[-1][0]).days < DMI_FETCH_SPAN_DAYS:
+            spans[-1] = (spans[-1][0], day + timedelta(days=1))
+        else:
+            spans.append((day, day + timedelta(days=1)))
+    return spans
+
+
+def update_dmi_cache(end=None) -> None:
+    """Ensure cache exists from DMI_START_CACHE_DATE to ``end`` (default today).
+
+    Missing days are grouped into spans of up to ``DMI_FETCH_SPAN_DAYS`` and
+    fetched as filtered, paginated interval queries on a bounded thread pool
+    sharing one session, limited to ``DMI_REQUESTS_PER_SECOND`` with
+    exponential backoff on failures. The results are split back into one
+    file per day. Progress is available from :func:`get_backfill_progress`.
+    """
     if not DMI_START_CACHE_DATE:
         return
 
     _ensure_cache_dir()
 
     start_date = datetime.fromisoformat(DMI_START_CACHE_DATE).date()
-    end_date = datetime.utcnow().date()
-    current = start_date
-    while current <= end_date:
-        if not _is_day_cached(current):
-            data = _fetch_dmi_day(current)
-            if data is not None:
-                print(f"Caching DMI data for {current}")
-                _save_day_cache(current, data)
-        current += timedelta(days=1)
+    end_date = end or datetime.utcnow().date()
+    missing = get_manifest().gaps(start_date, end_date)
+
+    with _progress_lock:
+        _progress.__init__(total=len(missing), running=True, started_at=time.time())
+        _save_progress()
+    try:
+        with ThreadPoolExecutor(max_workers=max(DMI_FETCH_WORKERS, 1)) as pool:
+            list(pool.map(_update_span, _missing_spans(missing)))
+    finally:
+        with _progress_lock:
+            _progress.running = False
+            _progress.finished_at = time.time()
+            _save_progress()
+
+
+def compact_weather_cache() -> int:
+    """Compact the complete cached days into the columnar weather store.
+
+    Returns the number of month partitions rewritten; see :mod:`weather_store`.
+    """
+    return weather_store.compact({day: _cache_file_path(day) for day in get_manifest().ok_days()})
 
 
 def _worker() -> None:
+    # Every server process starts this thread, but only the holder of the
+    # lock updates the cache; the others wait here and take over if it exits.
+    hold_lock(DMI_WORKER_LOCK)
     while True:
         print("Running DMI cache update")
         update_dmi_cache()
+        print(f"Compacted {compact_weather_cache()} DMI month partitions")
         time.sleep(3600)
 
 
@@ -84,38 +479,12 @@ def get_cached_date_range() -> Optional[Tuple[datetime.date, datetime.date]]:
 
     The cache directory may contain gaps if some days failed to download.
     To avoid exposing missing dates in the UI, this function only returns a
-    range where every day has a corresponding ``YYYY-MM-DD.json`` file.  If no
-    valid cache files are found, ``None`` is returned.
+    range where every day is recorded as ``ok`` in the cache manifest.  If no
+    days are cached, ``None`` is returned.
     """
+    return get_manifest().longest_range()
 
-    if not os.path.isdir(DMI_CACHE_DIR):
-        return None
-
-    dates = []
-    for name in os.listdir(DMI_CACHE_DIR):
-        if not name.endswith(".json"):
-            continue
-        try:
-            dates.append(datetime.strptime(os.path.splitext(name)[0], "%Y-%m-%d").date())
-        except ValueError:
-            continue
-
-    if not dates:
-        return None
-
-    dates.sort()
-
-    # Build contiguous ranges of dates with no missing days
-    ranges = []
-    start = prev = dates[0]
-    for current in dates[1:]:
-        if (current - prev).days == 1:
-            prev = current
-        else:
-            ranges.append((start, prev))
-            start = prev = current
-    ranges.append((start, prev))
 
-    # Pick the longest contiguous range
-    longest = max(ranges, key=lambda r: (r[1] - r[0]).days)
-    return longest
+def get_cache_gaps(start, end) -> List:
+    """Return the days in ``[start, end]`` missing from the cache."""
+    return get_manifest().gaps(start, end)
@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import base64
+from threading import Lock
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from ratelimit import upstream_limiter
+
+# https://api.eloverblik.dk/CustomerApi/swagger/index.html
+ELOVERBLIK_API_URL = os.environ.get("ELOVERBLIK_API_URL", "https://api.eloverblik.dk/CustomerApi/api")
+ELOVERBLIK_TIMEOUT = float(os.environ.get("ELOVERBLIK_TIMEOUT", "120"))
+ELOVERBLIK_CONNECT_TIMEOUT = float(os.environ.get("ELOVERBLIK_CONNECT_TIMEOUT", "10"))
+ELOVERBLIK_POOL_SIZE = int(os.environ.get("ELOVERBLIK_POOL_SIZE", "10"))
+ELOVERBLIK_RETRIES = int(os.environ.get("ELOVERBLIK_RETRIES", "5"))
+ELOVERBLIK_BACKOFF = float(os.environ.get("ELOVERBLIK_BACKOFF", "1.0"))
+# Requests per second across all processes on the host; 0 leaves throttling to 429 retries.
+ELOVERBLIK_REQUESTS_PER_SECOND = float(os.environ.get("ELOVERBLIK_REQUESTS_PER_SECOND", "0"))
+
+# Refresh the data access token this many seconds before it expires.
+TOKEN_EXPIRY_MARGIN = 300
+# Used when the token carries no readable ``exp`` claim.
+DEFAULT_TOKEN_LIFETIME = 3600
+
+
+def _build_session(pool_size: int = ELOVERBLIK_POOL_SIZE) -> requests.Session:
+    """Return a keep-alive session retrying 429/503 with exponential backoff."""
+    retry = Retry(
+        total=ELOVERBLIK_RETRIES,
+        connect=ELOVERBLIK_RETRIES,
+        backoff_factor=ELOVERBLIK_BACKOFF,
+        status_forcelist=(429, 503),
+        allowed_methods=None,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                          max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"accept": "application/json"})
+    return session
+
+
+def _token_expiry(token: str) -> float:
+    """Return the expiry of a JWT as a unix timestamp.
+
+    The signature is not verified; the claim is only used to decide when to
+    fetch a new token.
+    """
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return time.time() + DEFAULT_TOKEN_LIFETIME
+
+
+class EloverblikClient:
+    """Client for the Eloverblik customer API bound to one refresh token.
+
+    The short-lived data access token is cached until shortly before it
+    expires, and all requests share one pooled session.
+    """
+
+    def __init__(self, refresh_token: str, session: Optional[requests.Session] = None):
+        self.refresh_token = refresh_token
+        self.session = session or _get_session()
+        self._lock = Lock()
+        self._access_token: Optional[str] = None
+        self._expires_at = 0.0
+
+    @property
+    def timeout(self):
+        return (ELOVERBLIK_CONNECT_TIMEOUT, ELOVERBLIK_TIMEOUT)
+
+    def _fetch_access_token(self) -> str:
+        _limiter.wait()
+        resp = self.session.get(
+            f"{ELOVERBLIK_API_URL}/token",
+            headers={"Authorization": "Bearer " + self.refresh_token},
+            timeout=self.timeout,
+        )
+        if resp.status_code != 200:
+            raise Exception("Could not fetch data access token from Eloverblik.dk")
+        return resp.json()["result"]
+
+    def access_token(self) -> str:
+        with self._lock:
+            if self._access_token is None or time.time() >= self._expires_at - TOKEN_EXPIRY_MARGIN:
+                token = self._fetch_access_token()
+                self._access_token = token
+                self._expires_at = _token_expiry(token)
+            return self._access_token
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._access_token = None
+            self._expires_at = 0.0
+
+    def headers(self) -> Dict[str, str]:
+        return {
+            "accept": "application/json",
+            "Authorization": "Bearer " + self.access_token(),
+        }
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """Send an authenticated request, renewing the token once on 401."""
+        kwargs.setdefault("timeout", self.timeout)
+        url = f"{ELOVERBLIK_API_URL}/{path.lstrip('/')}"
+        headers = self.headers()
+        _limiter.wait()
+        resp = self.session.request(method, url, headers=headers, **kwargs)
+        if resp.status_code == 401:
+            self.invalidate()
+            headers = self.headers()
+            _limiter.wait()
+            resp = self.session.request(method, url, headers=headers, **kwargs)
+        return resp
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request("POST", path, **kwargs)
+
+
+_limiter = upstream_limiter("eloverblik", ELOVERBLIK_REQUESTS_PER_SECOND)
+_session: Optional[requests.Session] = None
+_clients: Dict[str, EloverblikClient] = {}
+_clients_lock = Lock()
+
+
+def _get_session() -> requests.Session:
+    global _session
+    with _clients_lock:
+        if _session is None:
+            _session = _build_session()
+        return _session
+
+
+def get_client(refresh_token: str) -> EloverblikClient:
+    """Return the shared client for ``refresh_token``."""
+    session = _get_session()
+    with _clients_lock:
+        client = _clients.get(refresh_token)
+        if client is None:
+            client = EloverblikClient(refresh_token, session=session)
+            _clients[refresh_token] = client
+        return client
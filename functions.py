@@ -1,9 +1,19 @@
-import json
-import requests
+import os
+import ijson
+import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
-from pyeloverblik import Eloverblik
-from geopy.geocoders import Nominatim
+from array import array
+from datetime import timedelta
+
+import singleflight
+from eloverblik_client import get_client
+from geocode_cache import geocode
+from pvgis_cache import get_profile_cache
+import pv_model
+from sweep import SWEEP_SIZES_KW, SWEEP_TILTS, sweep_configurations
+from chunked_fetch import fetch_windows, month_windows
+from metering_store import MeteringStore, as_date
+from tariffs import TariffCache
 
 
 # def fetch_eloverblik_dataframe(days=365):
@@ -28,30 +38,146 @@ from geopy.geocoders import Nominatim
 #     return json.loads(data_out.body)
 
 
-def _data_to_dataframe(data):
-    df_out = pd.DataFrame()
-    measure_series = data[0]["MyEnergyData_MarketDocument"]["TimeSeries"]
-
-    for timeseries in measure_series:
-        days = timeseries["Period"]
-        mrid = timeseries["mRID"]
+# Step length of each Eloverblik ``resolution`` code. Calendar resolutions
+# (days/months/years) have no fixed length and are handled in local time.
+_RESOLUTION_STEPS = {
+    "PT15M": timedelta(minutes=15),
+    "PT1H": timedelta(hours=1),
+}
+_CALENDAR_RESOLUTIONS = {"P1D": "D", "P1M": "MS", "P1Y": "YS"}
+_LOCAL_TZ = "Europe/Copenhagen"
+
+
+def _period_timestamps(start, resolution, positions):
+    """Return UTC timestamps (ns since epoch) for ``positions`` in a period."""
+    start = pd.Timestamp(start)
+    positions = np.asarray(positions, dtype=np.int64) - 1
+    if resolution in _CALENDAR_RESOLUTIONS:
+        local_start = start.tz_convert(_LOCAL_TZ)
+        stamps = pd.date_range(local_start, periods=int(positions.max()) + 1,
+                               freq=_CALENDAR_RESOLUTIONS[resolution])
+        return stamps.tz_convert("UTC").as_unit("ns").asi8[positions]
+    step = _RESOLUTION_STEPS.get(resolution, _RESOLUTION_STEPS["PT1H"])
+    return start.value + positions * pd.Timedelta(step).value
+
+
+def _columns_to_dataframe(columns):
+    """Build one DataFrame from ``{mRID: (timestamp arrays, values)}``."""
+    series = []
+    for mrid, (stamps, values) in columns.items():
+        if not stamps:
+            continue
+        index = pd.to_datetime(np.concatenate(stamps), utc=True)
+        s = pd.Series(np.asarray(values, dtype=np.float64), index=index, name=mrid)
+        s = s[~s.index.duplicated(keep="last")].sort_index()
+        series.append(s)
+
+    if not series:
+        return pd.DataFrame()
+    return pd.concat(series, axis=1)
 
-        for day in days:
-            start_date = day["timeInterval"]["start"]
-            end_date = day["timeInterval"]["end"]
 
-            # Generate a date range with hourly frequency
-            date_range = pd.date_range(
-                start=start_date, end=end_date, freq='H')[:-1]
-            measurement_data = [entry["out_Quantity.quantity"]
-                                for entry in day["Point"]]
-
-            # Create a DataFrame with the date range
-            df = pd.DataFrame(data=measurement_data,
-                              index=date_range, columns=[mrid])
-            df_out = pd.concat([df_out, df])
-        df_out[mrid] = pd.to_numeric(df_out[mrid])
-    return df_out
+def _data_to_dataframe(data):
+    """Convert Eloverblik time series results into one DataFrame.
+
+    All points are collected into flat arrays in a single pass and the frame
+    is built once. Timestamps are derived from each period's ``start``,
+    ``resolution`` and the point ``position``, so missing positions stay
+    missing and DST days get their actual number of hours.
+    """
+    columns = {}
+    for result in data:
+        document = result.get("MyEnergyData_MarketDocument")
+        if not document:
+            continue
+        for timeseries in document["TimeSeries"]:
+            stamps, values = columns.setdefault(timeseries["mRID"], ([], []))
+            for period in timeseries["Period"]:
+                points = period["Point"]
+                if not points:
+                    continue
+                stamps.append(_period_timestamps(
+                    period["timeInterval"]["start"],
+                    period.get("resolution"),
+                    [point["position"] for point in points]))
+                values.extend(point["out_Quantity.quantity"] for point in points)
+    return _columns_to_dataframe(columns)
+
+
+_DOCUMENT = "result.item"
+_TIMESERIES = _DOCUMENT + ".MyEnergyData_MarketDocument.TimeSeries.item"
+_PERIOD = _TIMESERIES + ".Period.item"
+_POINT = _PERIOD + ".Point.item"
+
+
+def _stream_metering_data(fp):
+    """Parse a ``gettimeseries`` response body incrementally.
+
+    Tokens are read from the file-like ``fp`` and point values go straight
+    into compact numeric buffers, so the document tree is never built.
+    Returns ``(columns, documents)`` where ``columns`` is accepted by
+    :func:`_columns_to_dataframe` and ``documents`` holds the ``id``,
+    ``success`` flag and time series ``mRIDs`` of each result document.
+    """
+    columns = {}
+    documents = []
+    document = None
+    mrid = resolution = start = position = quantity = None
+    series_stamps = series_values = positions = quantities = None
+
+    for prefix, event, value in ijson.parse(fp, use_float=True):
+        if prefix == _POINT:
+            if event == "start_map":
+                position = quantity = None
+            elif event == "end_map" and position is not None and quantity is not None:
+                positions.append(position)
+                quantities.append(quantity)
+        elif prefix == _POINT + ".position":
+            position = int(value)
+        elif prefix == _POINT + ".out_Quantity.quantity":
+            quantity = float(value)
+        elif prefix == _PERIOD:
+            if event == "start_map":
+                resolution = start = None
+                positions, quantities = array("q"), array("d")
+            elif event == "end_map" and positions:
+                series_stamps.append(_period_timestamps(start, resolution, positions))
+                series_values.extend(quantities)
+        elif prefix == _PERIOD + ".resolution":
+            resolution = value
+        elif prefix == _PERIOD + ".timeInterval.start":
+            start = value
+        elif prefix == _TIMESERIES:
+            if event == "start_map":
+                mrid = None
+                series_stamps, series_values = [], array("d")
+            elif event == "end_map":
+                stamps, values = columns.setdefault(mrid, ([], array("d")))
+                stamps.extend(series_stamps)
+                values.extend(series_values)
+                document["mRIDs"].append(mrid)
+        elif prefix == _TIMESERIES + ".mRID":
+            mrid = value
+        elif prefix == _DOCUMENT:
+            if event == "start_map":
+                document = {"mRIDs": []}
+                documents.append(document)
+        elif prefix == _DOCUMENT + ".id":
+            document["id"] = value
+        elif prefix == _DOCUMENT + ".success":
+            document["success"] = value
+    return columns, documents
+
+
+def _merge_columns(parts):
+    """Concatenate column dicts from :func:`_stream_metering_data` in order."""
+    merged = {}
+    for columns in parts:
+        for mrid, (stamps, values) in columns.items():
+            merged_stamps, merged_values = merged.setdefault(mrid, ([], array("d")))
+            merged_stamps.extend(stamps)
+            merged_values.extend(values)
+    return merged
 
 
 # NEw
@@ -59,79 +185,225 @@ def _data_to_dataframe(data):
 # https://api.eloverblik.dk/CustomerApi/swagger/index.html
 # https://helmstedt.dk/2022/03/eldata-fra-eloverblik-dk-med-python/
 
-# Get data access token for subsequent requests
-def _get_headers(token):
-    get_data_access_token_url = 'https://api.eloverblik.dk/CustomerApi/api/token'
-    headers = {
-        'accept': 'application/json',
-        'Authorization': 'Bearer ' + token,
-    }
-
-    response = requests.get(get_data_access_token_url, headers=headers)
-    data_access_token = response.json()['result']
+# Identical concurrent Eloverblik calls (same token and request) share one response.
+_eloverblik_calls = singleflight.group('eloverblik')
 
-    # Get id of first meter - edit if you have more than one meter
-    metering_points_url = 'https://api.eloverblik.dk/CustomerApi/api/meteringpoints/meteringpoints'
-    headers = {
-        'accept': 'application/json',
-        'Authorization': 'Bearer ' + data_access_token,
-    }
 
-    return headers
+def get_metering_points(token):
+    def call():
+        resp = get_client(token).get('meteringpoints/meteringpoints')
+        if resp is None or resp.status_code != 200:
+            raise Exception("Could not fetch data from Eloverblik.dk")
+        return resp.json()['result']
 
+    return _eloverblik_calls.do(('meteringpoints', token), call)
 
-def get_metering_points(token):
 
-    # Get id of first meter - edit if you have more than one meter
-    metering_points_url = 'https://api.eloverblik.dk/CustomerApi/api/meteringpoints/meteringpoints'
-    headers = _get_headers(token)
-    resp = requests.get(metering_points_url, headers=headers)
-    print(resp)
-    if resp is None or resp.status_code != 200:
-        raise Exception("Could not fetch data from Eloverblik.dk")
-    meters = resp.json()['result']
-    return meters
+# Number of metering points sent in one Eloverblik request.
+METERING_POINTS_PER_REQUEST = int(os.environ.get("METERING_POINTS_PER_REQUEST", "10"))
 
+# Eloverblik aggregations from finest to coarsest, with the matching pandas
+# resample rule (applied in Danish local time).
+AGGREGATIONS = {
+    'Actual': None,
+    'Quarter': '15min',
+    'Hour': 'h',
+    'Day': 'D',
+    'Month': 'MS',
+    'Year': 'YS',
+}
 
-def _get_metering_data(token, metering_point_id, date_from, date_to):
 
-    # Get id of first meter - edit if you have more than one meter
-    metering_points_url = 'https://api.eloverblik.dk/CustomerApi/api/meteringpoints/meteringpoints'
-    headers = _get_headers(token)
+def _post_metering_data(token, metering_point_ids, date_from, date_to, aggregation='Actual',
+                        stream=False):
+    if isinstance(metering_point_ids, str):
+        metering_point_ids = [metering_point_ids]
 
-    # Try to get data
-    meter_data = 'https://api.eloverblik.dk/CustomerApi/api/meterdata/gettimeseries/'
     timeseries_data = {
         'dateFrom': date_from,
         'dateTo': date_to,
-        'aggregation': 'Actual'
+        'aggregation': aggregation
     }
 
-    meter_data_url = meter_data + timeseries_data['dateFrom'] + '/' + \
+    meter_data_url = 'meterdata/gettimeseries/' + timeseries_data['dateFrom'] + '/' + \
         timeseries_data['dateTo'] + '/' + timeseries_data['aggregation']
 
     meter_json = {
         "meteringPoints": {
-            "meteringPoint": [
-                metering_point_id
-            ]
+            "meteringPoint": list(metering_point_ids)
         }
     }
 
-    meter_data_request = requests.post(
-        meter_data_url, headers=headers, json=meter_json)
-
-    return meter_data_request.json()['result']
-
-
-def get_metering_dataframe(token, metering_point_id, date_from, date_to):
-    metering_data = _get_metering_data(token, metering_point_id, date_from, date_to)
-    df = _data_to_dataframe(metering_data)
-    return df
+    meter_data_request = get_client(token).post(meter_data_url, json=meter_json, stream=stream)
+    meter_data_request.raise_for_status()
+    return meter_data_request
+
+
+def _timeseries_key(kind, token, metering_point_ids, date_from, date_to, aggregation):
+    if isinstance(metering_point_ids, str):
+        metering_point_ids = [metering_point_ids]
+    return kind, token, tuple(metering_point_ids), date_from, date_to, aggregation
+
+
+def _stream_metering_columns(token, metering_point_ids, date_from, date_to, aggregation='Actual'):
+    """Fetch ``gettimeseries`` and decode it with :func:`_stream_metering_data`."""
+    def call():
+        with _post_metering_data(token, metering_point_ids, date_from, date_to,
+                                 aggregation, stream=True) as meter_data_request:
+            meter_data_request.raw.decode_content = True
+            return _stream_metering_data(meter_data_request.raw)
+
+    key = _timeseries_key('stream', token, metering_point_ids, date_from, date_to, aggregation)
+    return _eloverblik_calls.do(key, call)
+
+
+def _document_metering_point(document, batch):
+    if document.get('id'):
+        return document['id']
+    if document.get('mRIDs'):
+        return document['mRIDs'][0]
+    return batch[0] if len(batch) == 1 else None
+
+
+def _batches(items, size):
+    return [tuple(items[i:i + size]) for i in range(0, len(items), size)]
+
+
+def _aggregation_bounds(date_from, date_to, aggregation):
+    """Widen ``[date_from, date_to)`` to whole months/years for coarse aggregations.
+
+    Eloverblik sums partial months and years over the requested range only,
+    so those aggregations are always fetched and stored as whole periods.
+    """
+    date_from, date_to = as_date(date_from), as_date(date_to)
+    if aggregation == 'Month':
+        date_from = date_from.replace(day=1)
+        if date_to.day != 1:
+            date_to = (pd.Timestamp(date_to) + pd.offsets.MonthBegin()).date()
+    elif aggregation == 'Year':
+        date_from = date_from.replace(month=1, day=1)
+        if (date_to.month, date_to.day) != (1, 1):
+            date_to = date_to.replace(year=date_to.year + 1, month=1, day=1)
+    return date_from, date_to
+
+
+def _resample_local(df, aggregation):
+    """Sum ``df`` to ``aggregation`` periods starting at Danish local midnight."""
+    rule = AGGREGATIONS[aggregation]
+    if rule is None or df.empty:
+        return df
+    local = df.tz_convert(_LOCAL_TZ).resample(rule).sum(min_count=1)
+    return local.tz_convert('UTC')
+
+
+_metering_store = MeteringStore()
+
+
+def _fetch_missing(token, metering_point_ids, date_from, date_to, aggregation,
+                   progress, allow_partial):
+    """Fetch the days missing from the metering store and merge them in."""
+    # Group metering points by the windows they are missing.
+    months = 12 if aggregation == 'Year' else 1
+    missing = {}
+    for metering_point_id in metering_point_ids:
+        # Spans of months/years may start or end mid-period (settling days are
+        # never held), and Eloverblik would sum only the requested days.
+        windows = {window
+                   for span in _metering_store.missing_spans(metering_point_id, date_from, date_to, aggregation)
+                   for window in month_windows(*_aggregation_bounds(*span, aggregation), months=months)}
+        for window in windows:
+            missing.setdefault(window, []).append(metering_point_id)
+
+    windows, keys = [], []
+    for window in sorted(missing):
+        for batch in _batches(missing[window], METERING_POINTS_PER_REQUEST):
+            windows.append(window)
+            keys.append(batch)
+
+    def fetch(start, end, batch):
+        return _stream_metering_columns(
+            token, batch, start.isoformat(), end.isoformat(), aggregation)
+
+    results = fetch_windows(windows, fetch, keys=keys, progress=progress)
+    failed = [r for r in results if not r.ok]
+    if failed and not allow_partial:
+        raise failed[0].error
+
+    parts = []
+    spans = {metering_point_id: [] for metering_point_id in metering_point_ids}
+    for r in results:
+        if not r.ok:
+            continue
+        columns, documents = r.result
+        for document in documents:
+            # A failed metering point in a batch is fetched again next time.
+            metering_point_id = _document_metering_point(document, r.key)
+            if document.get('success', True) and metering_point_id in spans:
+                spans[metering_point_id].append((r.start, r.end))
+        parts.append(columns)
+
+    if parts:
+        df = _columns_to_dataframe(_merge_columns(parts))
+        for metering_point_id, fetched in spans.items():
+            if fetched:
+                _metering_store.merge(metering_point_id, df, fetched, aggregation)
+
+
+def get_metering_dataframes(token, metering_point_ids, date_from, date_to,
+                            aggregation='Actual', progress=None, allow_partial=True):
+    """Return metering data for several metering points as one wide frame.
+
+    The frame has one column per metering point, aligned on a common UTC
+    index. Days already held in the local metering store are served from
+    disk. Missing days are requested in monthly windows, and metering points
+    missing the same window share requests of up to
+    ``METERING_POINTS_PER_REQUEST`` points. Requests run on a bounded worker
+    pool and are parsed together in window order.
+
+    ``aggregation`` selects the granularity (one of ``AGGREGATIONS``). For
+    anything coarser than ``'Actual'``, metering points whose fine-grained
+    data is already stored for the whole range are resampled locally; the
+    others are requested with that aggregation from Eloverblik, which keeps
+    payloads small for overview charts.
+
+    Windows that still fail after retrying are left out of the result (and
+    fetched again next time) unless ``allow_partial`` is false, in which
+    case the first error is raised. ``progress(done, total, failed)``
+    reports each finished request.
+    """
+    if aggregation not in AGGREGATIONS:
+        raise ValueError(f"Unknown aggregation: {aggregation}")
+    metering_point_ids = list(dict.fromkeys(metering_point_ids))
+
+    local, remote = [], metering_point_ids
+    if aggregation != 'Actual':
+        date_from, date_to = _aggregation_bounds(date_from, date_to, aggregation)
+        local = [mp for mp in metering_point_ids
+                 if not _metering_store.missing_spans(mp, date_from, date_to)]
+        remote = [mp for mp in metering_point_ids if mp not in local]
+
+    if remote:
+        _fetch_missing(token, remote, date_from, date_to, aggregation,
+                       progress, allow_partial)
+
+    frames = []
+    for metering_point_id in metering_point_ids:
+        if metering_point_id in local:
+            frames.append(_resample_local(
+                _metering_store.read(metering_point_id, date_from, date_to), aggregation))
+        else:
+            frames.append(_metering_store.read(metering_point_id, date_from, date_to, aggregation))
+    return pd.concat(frames, axis=1) if frames else pd.DataFrame()
+
+
+def get_metering_dataframe(token, metering_point_id, date_from, date_to,
+                           aggregation='Actual', progress=None, allow_partial=True):
+    """Return metering data for ``[date_from, date_to)`` for one metering point."""
+    return get_metering_dataframes(token, [metering_point_id], date_from, date_to,
+                                   aggregation=aggregation, progress=progress,
+                                   allow_partial=allow_partial)
 
 def get_metering_charges(token, metering_point_id):
-    headers = _get_headers(token)
-
     meter_json = {
         "meteringPoints": {
             "meteringPoint": [
@@ -140,52 +412,95 @@ def get_metering_charges(token, metering_point_id):
         }
     }
 
-    # Charges
-    charges_data = 'https://api.eloverblik.dk/CustomerApi/api/meteringpoints/meteringpoint/getcharges'
-    charges_data_request = requests.post(
-        charges_data, headers=headers, json=meter_json)
+    def call():
+        # Charges
+        charges_data_request = get_client(token).post(
+            'meteringpoints/meteringpoint/getcharges', json=meter_json)
+        return charges_data_request.json()['result']
+
+    return _eloverblik_calls.do(('getcharges', token, metering_point_id), call)
 
-    return charges_data_request.json()['result']
+
+_tariff_cache = TariffCache()
+
+
+def get_tariff_schedule(token, metering_point_id):
+    """Return the compiled tariffs of a metering point (see :class:`tariffs.TariffSchedule`).
+
+    The charges are fetched and compiled once and reused for
+    ``TARIFF_CACHE_TTL`` seconds.
+    """
+    return _tariff_cache.get(token, metering_point_id, get_metering_charges)
 
 
 def _geocode_address(address):
-    geolocator = Nominatim(user_agent="eloverblik-solceller")
-    location = geolocator.geocode(address)
-    if location is None:
-        raise Exception("Kunne ikke finde adressen")
-    return location.latitude, location.longitude
+    return geocode(address)
+
+
+ORIENTATION_MAP = {
+    "Syd": 180,
+    "Øst": 90,
+    "Vest": 270,
+    "Syd-Øst": 135,
+    "Syd-Vest": 225,
+}
+
+
+PV_SOURCES = ("pvgis", "dmi")
+
 
+def simulate_pv_production(address, start_date, end_date, pv_size_kw, orientation="Syd", tilt=35,
+                           source="pvgis"):
+    """Return hourly PV output ``P`` (W) for ``start_date <= time <= end_date``.
 
-def simulate_pv_production(address, start_date, end_date, pv_size_kw, orientation="Syd", tilt=35):
+    With ``source="pvgis"`` the PVGIS profile for the site, orientation and
+    tilt is fetched once for all available years (2005-2020) and cached per
+    1 kWp, so changing the system size or the date window is answered
+    locally. With ``source="dmi"`` the output is modelled offline from the
+    cached DMI observations (see :mod:`pv_model`), for any period the
+    weather cache covers.
+    """
+    if source not in PV_SOURCES:
+        raise ValueError(f"Unknown PV source {source!r}, expected one of {PV_SOURCES}")
     lat, lon = _geocode_address(address)
-    orientation_map = {
-        "Syd": 180,
-        "Øst": 90,
-        "Vest": 270,
-        "Syd-Øst": 135,
-        "Syd-Vest": 225,
-    }
-    azimuth = orientation_map.get(orientation, 180)
-
-    start_year = pd.to_datetime(start_date).year
-    end_year = pd.to_datetime(end_date).year
-    # Clamp years to the range allowed by PVGIS (2005-2020)
-    start_year = min(max(start_year, 2005), 2020)
-    end_year = min(max(end_year, 2005), 2020)
-
-    url = (
-        "https://re.jrc.ec.europa.eu/api/v5_2/seriescalc?"
-        f"lat={lat}&lon={lon}&startyear={start_year}&endyear={end_year}&"
-        f"outputformat=json&peakpower={pv_size_kw}&loss=14&angle={tilt}&aspect={azimuth}&"
-        "pvtechchoice=crystSi&mountingplace=building&pvcalculation=1"
-    )
-
-    resp = requests.get(url)
-    resp.raise_for_status()
-    data = resp.json()
-    df = pd.DataFrame(data["outputs"]["hourly"])
-    df["time"] = pd.to_datetime(df["time"].str.replace(":", ""), format="%Y%m%d%H%M")
-    df = df[(df["time"] >= pd.to_datetime(start_date)) & (df["time"] <= pd.to_datetime(end_date))]
-    df.set_index("time", inplace=True)
-    df["P"] = pd.to_numeric(df["P"])
-    return df[["P"]]
+    azimuth = ORIENTATION_MAP.get(orientation, 180)
+    if source == "dmi":
+        return pv_model.simulate_production(lat, lon, azimuth, tilt, pv_size_kw, start_date, end_date)
+    return get_profile_cache().production(
+        lat, lon, azimuth, tilt, pv_size_kw, start_date, end_date)
+
+
+def typical_pv_production(address, start_date, end_date, pv_size_kw, orientation="Syd", tilt=35):
+    """Return hourly PV output ``P`` (W) for a typical year over any period.
+
+    Unlike :func:`simulate_pv_production` the period is not limited to the
+    PVGIS years: each UTC hour gets the mean output for its calendar day and
+    hour across 2005-2020. The index is tz-aware UTC, matching the metering
+    data.
+    """
+    lat, lon = _geocode_address(address)
+    azimuth = ORIENTATION_MAP.get(orientation, 180)
+    index = pd.date_range(pd.Timestamp(start_date).floor('h'), pd.Timestamp(end_date),
+                          freq='h', tz=None if pd.Timestamp(start_date).tz else 'UTC', name='time')
+    power = get_profile_cache().typical(lat, lon, azimuth, tilt, index)
+    return pd.DataFrame({'P': power * pv_size_kw}, index=index)
+
+
+def sweep_pv_systems(token, metering_point_id, address, date_from, date_to,
+                     sizes_kw=SWEEP_SIZES_KW, tilts=SWEEP_TILTS, consumption=None, **economics):
+    """Rank PV sizes, all orientations and tilts against a customer's consumption.
+
+    ``consumption`` (a Series) is used instead of fetching the metering
+    point when given. See :func:`sweep.sweep_configurations`; ``economics``
+    is passed on to it.
+    """
+    if consumption is None:
+        consumption = get_metering_dataframe(token, metering_point_id, date_from, date_to)[metering_point_id]
+    lat, lon = _geocode_address(address)
+    cache = get_profile_cache()
+
+    def profile(azimuth, tilt, index):
+        return cache.typical(lat, lon, azimuth, tilt, index)
+
+    return sweep_configurations(consumption, profile, ORIENTATION_MAP,
+                                sizes_kw, tilts, **economics)
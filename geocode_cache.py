@@ -0,0 +1,127 @@
+import os
+import re
+import time
+import sqlite3
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional, Tuple
+
+from geopy.geocoders import Nominatim
+
+import singleflight
+from process_lock import file_lock
+from ratelimit import RateLimiter
+
+GEOCODE_CACHE_PATH = os.environ.get("GEOCODE_CACHE_PATH", os.path.join("cache", "geocode.sqlite3"))
+GEOCODE_LRU_SIZE = int(os.environ.get("GEOCODE_LRU_SIZE", "1024"))
+# Nominatim's usage policy allows at most one request per second.
+NOMINATIM_RATE = float(os.environ.get("NOMINATIM_RATE", "1"))
+NOMINATIM_DOMAIN = os.environ.get("NOMINATIM_DOMAIN", "nominatim.openstreetmap.org")
+NOMINATIM_SCHEME = os.environ.get("NOMINATIM_SCHEME", "https")
+NOMINATIM_USER_AGENT = "eloverblik-solceller"
+
+Coordinates = Tuple[float, float]
+
+
+def normalize_address(address: str) -> str:
+    """Return a cache key that ignores case, spacing and comma placement."""
+    address = re.sub(r"\s*,\s*", ", ", address.casefold())
+    address = re.sub(r"\s+", " ", address)
+    return address.strip(" ,.")
+
+
+class GeocodeCache:
+    """Address to (lat, lon) lookups with memory, disk and network tiers.
+
+    Hits are served from an in-memory LRU first and a SQLite file second.
+    Concurrent misses for the same address share one Nominatim request, also
+    across processes using the same file, and all requests from those
+    processes are throttled to ``rate`` per second together.
+    """
+
+    def __init__(self, path: str = GEOCODE_CACHE_PATH, lru_size: int = GEOCODE_LRU_SIZE,
+                 rate: float = NOMINATIM_RATE):
+        self.path = path
+        self.lru_size = lru_size
+        self._memory: "OrderedDict[str, Coordinates]" = OrderedDict()
+        self._lock = Lock()
+        self._limiter = RateLimiter(rate, path + ".rate")
+        self._flight = singleflight.group("nominatim")
+        self._geolocator = Nominatim(user_agent=NOMINATIM_USER_AGENT, domain=NOMINATIM_DOMAIN,
+                                     scheme=NOMINATIM_SCHEME, timeout=10)
+        self._ensure_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _ensure_db(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS geocode ("
+                "address TEXT PRIMARY KEY, lat REAL NOT NULL, lon REAL NOT NULL, fetched_at REAL)"
+            )
+
+    def _remember(self, key: str, coordinates: Coordinates) -> None:
+        with self._lock:
+            self._memory[key] = coordinates
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.lru_size:
+                self._memory.popitem(last=False)
+
+    def _from_memory(self, key: str) -> Optional[Coordinates]:
+        with self._lock:
+            coordinates = self._memory.get(key)
+            if coordinates is not None:
+                self._memory.move_to_end(key)
+            return coordinates
+
+    def _from_disk(self, key: str) -> Optional[Coordinates]:
+        with self._connect() as db:
+            row = db.execute("SELECT lat, lon FROM geocode WHERE address = ?", (key,)).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def _to_disk(self, key: str, coordinates: Coordinates) -> None:
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO geocode VALUES (?, ?, ?, ?)",
+                       (key, coordinates[0], coordinates[1], time.time()))
+
+    def _geocode(self, address: str) -> Coordinates:
+        self._limiter.wait()
+        location = self._geolocator.geocode(address)
+        if location is None:
+            raise Exception("Kunne ikke finde adressen")
+        return location.latitude, location.longitude
+
+    def _resolve(self, key: str, address: str) -> Coordinates:
+        coordinates = self._from_disk(key)
+        if coordinates is None:
+            # Serialise misses across processes and re-check the shared file
+            with file_lock(self.path + ".lock"):
+                coordinates = self._from_disk(key)
+                if coordinates is None:
+                    coordinates = self._geocode(address)
+                    self._to_disk(key, coordinates)
+        self._remember(key, coordinates)
+        return coordinates
+
+    def lookup(self, address: str) -> Coordinates:
+        key = normalize_address(address)
+        coordinates = self._from_memory(key)
+        if coordinates is not None:
+            return coordinates
+        return self._flight.do(key, self._resolve, key, address)
+
+
+_cache: Optional[GeocodeCache] = None
+_cache_lock = Lock()
+
+
+def geocode(address: str) -> Coordinates:
+    """Return ``(lat, lon)`` for ``address`` using the shared cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = GeocodeCache()
+    return _cache.lookup(address)
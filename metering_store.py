@@ -0,0 +1,136 @@
+import os
+from datetime import date, datetime, timedelta
+from threading import Lock
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from columnar import load_columns, save_columns
+from process_lock import file_lock
+
+METERING_CACHE_DIR = os.environ.get("METERING_CACHE_DIR", os.path.join("cache", "metering"))
+# Eloverblik data for the most recent days is still being settled, so these
+# days are always re-fetched instead of being recorded as held.
+METERING_SETTLE_DAYS = int(os.environ.get("METERING_SETTLE_DAYS", "3"))
+LOCAL_TZ = "Europe/Copenhagen"
+
+def as_date(value) -> date:
+    """Return the calendar date of a date, datetime or ISO string."""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return pd.Timestamp(value).date()
+
+
+def _local_midnight_ns(day: date) -> int:
+    return pd.Timestamp(day).tz_localize(LOCAL_TZ).value
+
+
+def _day_spans(days: np.ndarray) -> List[Tuple[date, date]]:
+    """Group sorted ``datetime64[D]`` days into half-open ``[start, end)`` spans."""
+    if len(days) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(days).astype(np.int64) != 1) + 1
+    spans = []
+    for chunk in np.split(days, breaks):
+        start = chunk[0].astype(date)
+        spans.append((start, chunk[-1].astype(date) + timedelta(days=1)))
+    return spans
+
+
+class MeteringStore:
+    """Persistent per-metering-point store of Eloverblik time series.
+
+    Each metering point and aggregation is kept in one compressed columnar
+    file holding the UTC timestamps (ns), the values and the Danish calendar
+    days the store already holds. Callers fetch only the
+    :meth:`missing_spans` and :meth:`merge` them in; any range inside the
+    held days is served locally by :meth:`read`.
+    """
+
+    def __init__(self, cache_dir: str = METERING_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self._locks: Dict[str, Lock] = {}
+        self._locks_lock = Lock()
+        self._loaded: Dict[str, Tuple[int, Dict[str, np.ndarray]]] = {}
+
+    def _path(self, metering_point_id: str, aggregation: str) -> str:
+        name = metering_point_id if aggregation == "Actual" else f"{metering_point_id}_{aggregation}"
+        return os.path.join(self.cache_dir, f"{name}.npz")
+
+    def _lock(self, path: str) -> Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(path, Lock())
+
+    def _load(self, path: str) -> Dict[str, np.ndarray]:
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return {
+                "timestamp": np.empty(0, dtype=np.int64),
+                "value": np.empty(0, dtype=np.float64),
+                "day": np.empty(0, dtype="datetime64[D]"),
+            }
+        cached = self._loaded.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        columns = load_columns(path)
+        self._loaded[path] = (mtime, columns)
+        return columns
+
+    def held_days(self, metering_point_id: str, aggregation: str = "Actual") -> np.ndarray:
+        return self._load(self._path(metering_point_id, aggregation))["day"]
+
+    def missing_spans(self, metering_point_id: str, date_from, date_to,
+                      aggregation: str = "Actual") -> List[Tuple[date, date]]:
+        """Return the ``[start, end)`` spans in the range that are not held."""
+        wanted = np.arange(as_date(date_from), as_date(date_to), dtype="datetime64[D]")
+        missing = wanted[~np.isin(wanted, self.held_days(metering_point_id, aggregation))]
+        return _day_spans(missing)
+
+    def merge(self, metering_point_id: str, frame: pd.DataFrame,
+              spans: List[Tuple[date, date]], aggregation: str = "Actual") -> None:
+        """Merge fetched values and record the ``[start, end)`` spans as held.
+
+        ``frame`` is read from its ``metering_point_id`` column. Days that
+        are still settling are stored but not recorded as held.
+        """
+        settled_until = np.datetime64(date.today() - timedelta(days=METERING_SETTLE_DAYS), "D")
+        days = np.concatenate([np.empty(0, dtype="datetime64[D]")] + [
+            np.arange(as_date(start), as_date(end), dtype="datetime64[D]")
+            for start, end in spans
+        ])
+        days = days[days < settled_until]
+
+        if metering_point_id not in frame:
+            new_ts = np.empty(0, dtype=np.int64)
+            new_values = np.empty(0, dtype=np.float64)
+        else:
+            series = frame[metering_point_id].dropna()
+            new_ts = series.index.as_unit("ns").asi8
+            new_values = series.to_numpy(dtype=np.float64)
+
+        path = self._path(metering_point_id, aggregation)
+        with self._lock(path), file_lock(path + ".lock"):
+            current = self._load(path)
+            timestamps = np.concatenate([new_ts, current["timestamp"]])
+            values = np.concatenate([new_values, current["value"]])
+            # Keep the newly fetched value where timestamps overlap.
+            timestamps, first = np.unique(timestamps, return_index=True)
+            save_columns(path, {
+                "timestamp": timestamps,
+                "value": values[first],
+                "day": np.union1d(current["day"], days),
+            })
+
+    def read(self, metering_point_id: str, date_from, date_to,
+             aggregation: str = "Actual") -> pd.DataFrame:
+        """Return the stored values for the Danish days ``[date_from, date_to)``."""
+        columns = self._load(self._path(metering_point_id, aggregation))
+        timestamps = columns["timestamp"]
+        lo = np.searchsorted(timestamps, _local_midnight_ns(as_date(date_from)), side="left")
+        hi = np.searchsorted(timestamps, _local_midnight_ns(as_date(date_to)), side="left")
+        index = pd.to_datetime(timestamps[lo:hi], utc=True)
+        return pd.DataFrame({metering_point_id: columns["value"][lo:hi]}, index=index)
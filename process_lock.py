@@ -0,0 +1,36 @@
+import fcntl
+import os
+from contextlib import contextmanager
+from typing import Iterator
+
+
+def _open(path: str) -> int:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    return os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+
+
+@contextmanager
+def file_lock(path: str) -> Iterator[int]:
+    """Hold an exclusive ``flock`` on ``path`` across processes.
+
+    The lock file is created if needed and kept afterwards. The open file
+    descriptor is yielded so small state can be kept in the lock file itself.
+    """
+    fd = _open(path)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield fd
+    finally:
+        # Closing the descriptor releases the lock
+        os.close(fd)
+
+
+def hold_lock(path: str) -> int:
+    """Block until the exclusive lock on ``path`` is acquired and keep it.
+
+    The lock is held until the returned descriptor is closed or the process
+    exits, which makes it usable to elect one process among several.
+    """
+    fd = _open(path)
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    return fd
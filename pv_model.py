@@ -0,0 +1,165 @@
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from pvgis_cache import PVGIS_LOSS
+from weather_store import load_stations, load_weather, utc_naive
+
+PV_MODEL_ALBEDO = float(os.environ.get("PV_MODEL_ALBEDO", "0.2"))
+# Power temperature coefficient of crystalline silicon modules (1/K)
+PV_MODEL_GAMMA = -0.0037
+# Nominal operating cell temperature (°C at 800 W/m², 20 °C, 1 m/s)
+PV_MODEL_NOCT = 45.0
+SOLAR_CONSTANT = 1367.0
+# Below this cos(zenith) the sun is treated as set; avoids huge DNI at the horizon
+_MIN_COS_ZENITH = 0.065
+
+GHI_PARAMETER = "radia_glob"
+TEMPERATURE_PARAMETER = "temp_dry"
+
+
+def solar_position(index: pd.DatetimeIndex, lat: float, lon: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Return solar zenith and azimuth (degrees, 0 = north) at each UTC timestamp.
+
+    Uses the NOAA/Spencer series for the equation of time and declination,
+    which is accurate to well below a degree for irradiance modelling.
+    """
+    if index.tz is not None:
+        index = index.tz_convert("UTC")
+    doy = index.dayofyear.to_numpy()
+    hour = (index.hour.to_numpy() + index.minute.to_numpy() / 60 + index.second.to_numpy() / 3600)
+    gamma = 2 * np.pi / 365 * (doy - 1 + (hour - 12) / 24)
+    eqtime = 229.18 * (0.000075 + 0.001868 * np.cos(gamma) - 0.032077 * np.sin(gamma)
+                       - 0.014615 * np.cos(2 * gamma) - 0.040849 * np.sin(2 * gamma))
+    decl = (0.006918 - 0.399912 * np.cos(gamma) + 0.070257 * np.sin(gamma)
+            - 0.006758 * np.cos(2 * gamma) + 0.000907 * np.sin(2 * gamma)
+            - 0.002697 * np.cos(3 * gamma) + 0.00148 * np.sin(3 * gamma))
+    hour_angle = np.radians((hour * 60 + eqtime + 4 * lon) / 4 - 180)
+    phi = np.radians(lat)
+
+    cos_zenith = np.sin(phi) * np.sin(decl) + np.cos(phi) * np.cos(decl) * np.cos(hour_angle)
+    zenith = np.degrees(np.arccos(np.clip(cos_zenith, -1, 1)))
+    azimuth = np.degrees(np.arctan2(np.sin(hour_angle),
+                                    np.cos(hour_angle) * np.sin(phi) - np.tan(decl) * np.cos(phi))) + 180
+    return zenith, azimuth % 360
+
+
+def extraterrestrial_irradiance(index: pd.DatetimeIndex) -> np.ndarray:
+    """Return the normal irradiance at the top of the atmosphere (W/m²)."""
+    return SOLAR_CONSTANT * (1 + 0.033 * np.cos(2 * np.pi * index.dayofyear.to_numpy() / 365))
+
+
+def erbs(ghi: np.ndarray, zenith: np.ndarray, dni_extra: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Split global horizontal irradiance into direct normal and diffuse (Erbs et al. 1982)."""
+    cos_zenith = np.cos(np.radians(zenith))
+    up = cos_zenith > _MIN_COS_ZENITH
+    with np.errstate(divide="ignore", invalid="ignore"):
+        kt = np.where(up, ghi / (dni_extra * cos_zenith), 0.0)
+    kt = np.clip(kt, 0, 1)
+    fraction = np.where(
+        kt <= 0.22, 1 - 0.09 * kt,
+        np.where(kt <= 0.8,
+                 0.9511 - 0.1604 * kt + 4.388 * kt ** 2 - 16.638 * kt ** 3 + 12.336 * kt ** 4,
+                 0.165))
+    dhi = np.where(up, fraction * ghi, ghi)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dni = np.where(up, (ghi - dhi) / cos_zenith, 0.0)
+    return np.maximum(dni, 0.0), dhi
+
+
+def plane_of_array(ghi: np.ndarray, dni: np.ndarray, dhi: np.ndarray, zenith: np.ndarray,
+                   solar_azimuth: np.ndarray, tilt: float, azimuth: float,
+                   albedo: float = PV_MODEL_ALBEDO) -> np.ndarray:
+    """Return plane-of-array irradiance (W/m²) with an isotropic sky model.
+
+    ``azimuth`` of the modules is a compass bearing (180 = south) and
+    ``tilt`` is measured from horizontal.
+    """
+    zen, beta = np.radians(zenith), np.radians(tilt)
+    cos_aoi = (np.cos(zen) * np.cos(beta)
+               + np.sin(zen) * np.sin(beta) * np.cos(np.radians(solar_azimuth - azimuth)))
+    beam = dni * np.maximum(cos_aoi, 0.0)
+    sky = dhi * (1 + np.cos(beta)) / 2
+    ground = ghi * albedo * (1 - np.cos(beta)) / 2
+    return beam + sky + ground
+
+
+def cell_temperature(poa: np.ndarray, temp_air: np.ndarray, noct: float = PV_MODEL_NOCT) -> np.ndarray:
+    """Return the module temperature (°C) from the NOCT model."""
+    return temp_air + poa * (noct - 20) / 800
+
+
+def pvwatts_ac(poa: np.ndarray, temp_cell: np.ndarray, pv_size_kw: float,
+               loss: float = PVGIS_LOSS, gamma: float = PV_MODEL_GAMMA) -> np.ndarray:
+    """Return AC power (W) of a PVWatts-style system clipped at its nominal size.
+
+    ``loss`` is the total system loss in percent, as in PVGIS.
+    """
+    nominal = pv_size_kw * 1000
+    dc = nominal * poa / 1000 * (1 + gamma * (temp_cell - 25))
+    return np.clip(dc * (1 - loss / 100), 0, nominal)
+
+
+def nearest_station(lat: float, lon: float, stations: pd.DataFrame) -> Optional[str]:
+    """Return the id of the station in ``stations`` (``lon``/``lat`` columns) closest to the site."""
+    if stations.empty:
+        return None
+    phi1, phi2 = np.radians(lat), np.radians(stations["lat"].to_numpy())
+    dphi = phi2 - phi1
+    dlambda = np.radians(stations["lon"].to_numpy() - lon)
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return stations.index[int(np.argmin(a))]
+
+
+def _station_series(weather: pd.DataFrame, stations: pd.DataFrame, parameter: str,
+                    lat: float, lon: float) -> pd.Series:
+    observed = weather[weather["parameter"] == parameter]
+    station = nearest_station(lat, lon, stations[stations.index.isin(observed["station"].unique())])
+    if station is None:
+        return pd.Series(dtype=np.float64)
+    series = observed[observed["station"] == station]
+    return pd.Series(series["value"].to_numpy(np.float64), index=pd.DatetimeIndex(series["time"]))
+
+
+def simulate_production(lat: float, lon: float, azimuth: float, tilt: float, pv_size_kw: float,
+                        start, end, loss: float = PVGIS_LOSS) -> pd.DataFrame:
+    """Return hourly PV output ``P`` (W) for ``start <= time <= end`` from DMI observations.
+
+    Global radiation and air temperature are taken from the nearest cached
+    stations that observed them in the period. The sun position is evaluated
+    at the middle of each observation interval (DMI timestamps mark its
+    end), global radiation is split with Erbs, transposed to the module
+    plane and converted with a PVWatts model; the result is averaged to
+    hours. The index is naive UTC named ``time``, like the PVGIS source.
+    Hours without radiation observations are left out.
+    """
+    first, last = utc_naive(start), utc_naive(end)
+    weather = load_weather(first, last + pd.Timedelta(hours=1),
+                           parameters=[GHI_PARAMETER, TEMPERATURE_PARAMETER])
+    stations = load_stations()
+    ghi = _station_series(weather, stations, GHI_PARAMETER, lat, lon)
+    if ghi.empty:
+        return pd.DataFrame({"P": pd.Series([], dtype=np.float64)},
+                            index=pd.DatetimeIndex([], name="time"))
+
+    step = pd.Series(ghi.index).diff().median()
+    middle = ghi.index - (step / 2 if pd.notna(step) else pd.Timedelta(0))
+    temperature = _station_series(weather, stations, TEMPERATURE_PARAMETER, lat, lon)
+    if temperature.empty:
+        # Without any temperature the model runs at standard test conditions
+        temp_air = np.full(len(ghi), 25.0)
+    else:
+        temp_air = temperature.resample("h").mean().reindex(middle.floor("h")).ffill().bfill().to_numpy()
+
+    zenith, solar_azimuth = solar_position(middle, lat, lon)
+    ghi_values = np.maximum(ghi.to_numpy(), 0.0)
+    dni, dhi = erbs(ghi_values, zenith, extraterrestrial_irradiance(middle))
+    poa = plane_of_array(ghi_values, dni, dhi, zenith, solar_azimuth, tilt, azimuth)
+    power = pvwatts_ac(poa, cell_temperature(poa, temp_air), pv_size_kw, loss)
+
+    hourly = pd.Series(power, index=middle.tz_convert("UTC").tz_localize(None)).resample("h").mean().dropna()
+    hourly = hourly[(hourly.index >= first) & (hourly.index <= last)]
+    hourly.index.name = "time"
+    return hourly.to_frame("P")
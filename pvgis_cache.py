@@ -0,0 +1,168 @@
+import os
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import requests
+
+import singleflight
+from columnar import load_columns, save_columns
+from process_lock import file_lock
+from ratelimit import upstream_limiter
+
+PVGIS_API_URL = os.environ.get("PVGIS_API_URL", "https://re.jrc.ec.europa.eu/api/v5_2/seriescalc")
+PVGIS_CACHE_DIR = os.environ.get("PVGIS_CACHE_DIR", os.path.join("cache", "pvgis"))
+PVGIS_LRU_SIZE = int(os.environ.get("PVGIS_LRU_SIZE", "32"))
+# Years covered by the PVGIS v5.2 hourly radiation database
+PVGIS_FIRST_YEAR = 2005
+PVGIS_LAST_YEAR = 2020
+PVGIS_LOSS = 14
+# PVGIS allows 30 calls per second per IP; shared by all processes on the host.
+PVGIS_REQUESTS_PER_SECOND = float(os.environ.get("PVGIS_REQUESTS_PER_SECOND", "25"))
+
+ProfileKey = Tuple[float, float, int, int, float]
+
+_limiter = upstream_limiter("pvgis", PVGIS_REQUESTS_PER_SECOND)
+
+
+def profile_key(lat: float, lon: float, azimuth: float, tilt: float, loss: float = PVGIS_LOSS) -> ProfileKey:
+    """Return the cache key of a profile; coordinates are rounded to ~1 km."""
+    return round(lat, 2), round(lon, 2), int(round(azimuth)) % 360, int(round(tilt)), float(loss)
+
+
+def _fetch_profile(key: ProfileKey) -> Tuple[np.ndarray, np.ndarray]:
+    """Fetch hourly output of a 1 kWp system for all PVGIS years.
+
+    ``azimuth`` in the key is a compass bearing (180 = south); PVGIS expects
+    its ``aspect`` relative to south (0 = south, 90 = west, -90 = east).
+    """
+    lat, lon, azimuth, tilt, loss = key
+    params = {
+        "lat": lat,
+        "lon": lon,
+        "startyear": PVGIS_FIRST_YEAR,
+        "endyear": PVGIS_LAST_YEAR,
+        "outputformat": "json",
+        "peakpower": 1,
+        "loss": loss,
+        "angle": tilt,
+        "aspect": azimuth - 180,
+        "pvtechchoice": "crystSi",
+        "mountingplace": "building",
+        "pvcalculation": 1,
+    }
+    _limiter.wait()
+    resp = requests.get(PVGIS_API_URL, params=params, timeout=120)
+    resp.raise_for_status()
+    hourly = resp.json()["outputs"]["hourly"]
+    times = pd.to_datetime([row["time"].replace(":", "") for row in hourly], format="%Y%m%d%H%M")
+    power = np.fromiter((row["P"] for row in hourly), dtype=np.float64, count=len(hourly))
+    return times.as_unit("ns").asi8, power
+
+
+class PVGISProfileCache:
+    """Hourly PVGIS output normalised to 1 kWp, kept in memory and on disk.
+
+    One profile is fetched per rounded site, azimuth, tilt and loss for the
+    whole PVGIS year span; any system size and date window is then served by
+    scaling and slicing it locally.
+    """
+
+    def __init__(self, cache_dir: str = PVGIS_CACHE_DIR, lru_size: int = PVGIS_LRU_SIZE):
+        self.cache_dir = cache_dir
+        self.lru_size = lru_size
+        self._memory: "OrderedDict[ProfileKey, Tuple[np.ndarray, np.ndarray]]" = OrderedDict()
+        self._typical: Dict[ProfileKey, np.ndarray] = {}
+        self._lock = Lock()
+        # Concurrent requests for the same profile share one load or fetch
+        self._flight = singleflight.group("pvgis")
+
+    def _path(self, key: ProfileKey) -> str:
+        return os.path.join(self.cache_dir, "{:.2f}_{:.2f}_{}_{}_{:g}.npz".format(*key))
+
+    def _load_file(self, key: ProfileKey) -> Tuple[np.ndarray, np.ndarray]:
+        path = self._path(key)
+        # Other processes may be fetching the same profile; the first one
+        # writes the file and the rest read it after the lock is released.
+        with file_lock(path + ".lock"):
+            if os.path.exists(path):
+                columns = load_columns(path)
+                return columns["time"], columns["P"]
+            profile = _fetch_profile(key)
+            save_columns(path, {"time": profile[0], "P": profile[1]})
+            return profile
+
+    def _load(self, key: ProfileKey) -> Tuple[np.ndarray, np.ndarray]:
+        with self._lock:
+            profile = self._memory.get(key)
+            if profile is not None:
+                self._memory.move_to_end(key)
+                return profile
+
+        profile = self._flight.do(key, self._load_file, key)
+        with self._lock:
+            self._memory[key] = profile
+            while len(self._memory) > self.lru_size:
+                self._memory.popitem(last=False)
+        return profile
+
+    def profile(self, lat: float, lon: float, azimuth: float, tilt: float,
+                loss: float = PVGIS_LOSS) -> pd.Series:
+        """Return the full 1 kWp profile ``P`` (W) indexed by naive UTC time."""
+        times, power = self._load(profile_key(lat, lon, azimuth, tilt, loss))
+        return pd.Series(power, index=pd.DatetimeIndex(times, name="time"), name="P")
+
+    def production(self, lat: float, lon: float, azimuth: float, tilt: float,
+                   pv_size_kw: float, start, end, loss: float = PVGIS_LOSS) -> pd.DataFrame:
+        """Return ``P`` (W) of a ``pv_size_kw`` system for ``start <= time <= end``."""
+        times, power = self._load(profile_key(lat, lon, azimuth, tilt, loss))
+        lo = np.searchsorted(times, pd.Timestamp(start).value, side="left")
+        hi = np.searchsorted(times, pd.Timestamp(end).value, side="right")
+        index = pd.DatetimeIndex(times[lo:hi], name="time")
+        return pd.DataFrame({"P": power[lo:hi] * pv_size_kw}, index=index)
+
+    def _typical_table(self, key: ProfileKey) -> np.ndarray:
+        table = self._typical.get(key)
+        if table is None:
+            times, power = self._load(key)
+            slots = _calendar_slots(pd.DatetimeIndex(times))
+            sums = np.bincount(slots, weights=power, minlength=366 * 24)
+            counts = np.bincount(slots, minlength=366 * 24)
+            table = sums / np.maximum(counts, 1)
+            self._typical[key] = table
+        return table
+
+    def typical(self, lat: float, lon: float, azimuth: float, tilt: float,
+                index: pd.DatetimeIndex, loss: float = PVGIS_LOSS) -> np.ndarray:
+        """Return the mean 1 kWp power (W) at each timestamp of ``index``.
+
+        Each timestamp is mapped to its UTC calendar day and hour and gets the
+        average over all PVGIS years, so any period (e.g. recent metering
+        data outside 2005-2020) can be paired with a typical year.
+        """
+        table = self._typical_table(profile_key(lat, lon, azimuth, tilt, loss))
+        if index.tz is not None:
+            index = index.tz_convert("UTC")
+        return table[_calendar_slots(index)]
+
+
+def _calendar_slots(index: pd.DatetimeIndex) -> np.ndarray:
+    """Return the (day of leap year, hour) slot of each timestamp as one int."""
+    day = index.dayofyear.to_numpy() - 1
+    # Shift March-December of common years so 1 March is always day 60
+    day += (~index.is_leap_year & (index.month > 2)).astype(int)
+    return day * 24 + index.hour.to_numpy()
+
+
+_cache: Optional[PVGISProfileCache] = None
+_cache_lock = Lock()
+
+
+def get_profile_cache() -> PVGISProfileCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PVGISProfileCache()
+        return _cache
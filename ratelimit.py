@@ -0,0 +1,67 @@
+import os
+import time
+from threading import Lock
+from typing import Dict, Optional
+
+from process_lock import file_lock
+
+# Limiters of upstream services keep their next slot here, shared by every
+# process (web workers, background jobs, batch workers) on the host.
+RATE_LIMIT_DIR = os.environ.get("RATE_LIMIT_DIR", os.path.join("cache", "ratelimit"))
+
+
+class RateLimiter:
+    """Space calls so at most ``rate`` start per second across threads.
+
+    With ``path`` the next free slot is kept in that file under a file
+    lock, so the limit is shared by every process using the same path.
+    """
+
+    def __init__(self, rate: float, path: Optional[str] = None):
+        self.path = path
+        self._lock = Lock()
+        self._next = 0.0
+        self.set_rate(rate)
+
+    def set_rate(self, rate: float) -> None:
+        """Change the limit; a rate of 0 or less disables it."""
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+
+    def _reserve(self) -> float:
+        if self.path is None:
+            start = max(self._next, time.monotonic())
+            self._next = start + self.interval
+            return start - time.monotonic()
+        with file_lock(self.path) as fd:
+            raw = os.pread(fd, 64, 0)
+            now = time.time()
+            start = max(float(raw or 0), now)
+            os.ftruncate(fd, 0)
+            os.pwrite(fd, repr(start + self.interval).encode(), 0)
+        return start - now
+
+    def wait(self) -> None:
+        """Block until the caller may start its next call."""
+        if not self.interval:
+            return
+        with self._lock:
+            delay = self._reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+
+_upstreams: Dict[str, RateLimiter] = {}
+_upstreams_lock = Lock()
+
+
+def upstream_limiter(name: str, rate: float) -> RateLimiter:
+    """Return the process-wide limiter of upstream ``name``, shared through ``RATE_LIMIT_DIR``.
+
+    ``rate`` only applies when the limiter is created; use
+    :meth:`RateLimiter.set_rate` to change it later.
+    """
+    with _upstreams_lock:
+        limiter = _upstreams.get(name)
+        if limiter is None:
+            limiter = _upstreams[name] = RateLimiter(rate, os.path.join(RATE_LIMIT_DIR, f"{name}.rate"))
+        return limiter
@@ -0,0 +1,65 @@
+import os
+import uuid
+from threading import Lock
+from typing import Any, Optional
+
+import diskcache
+
+RESULT_STORE_DIR = os.environ.get("RESULT_STORE_DIR", os.path.join("cache", "results"))
+RESULT_STORE_MAX_MB = float(os.environ.get("RESULT_STORE_MAX_MB", "256"))
+
+
+class ResultStore:
+    """Server-side store of callback results keyed by browser session.
+
+    Callbacks keep their DataFrames here and send only a short handle to the
+    browser. Each session holds one result per name; storing a name again
+    replaces it. The results live in a disk-backed cache shared by every
+    process on the host (background callbacks run in their own processes),
+    and the least recently used results are evicted once the cache exceeds
+    ``max_bytes``. A handle of an evicted or replaced result resolves to
+    ``None``.
+    """
+
+    def __init__(self, directory: str = RESULT_STORE_DIR,
+                 max_bytes: int = int(RESULT_STORE_MAX_MB * 1024 * 1024)):
+        self.max_bytes = max_bytes
+        self._cache = diskcache.Cache(directory, size_limit=max_bytes,
+                                      eviction_policy="least-recently-used", tag_index=True)
+
+    def put(self, session_id: str, name: str, frame: Any) -> str:
+        """Store ``frame`` (a DataFrame or a dict of them) for the session and return its handle."""
+        version = uuid.uuid4().hex[:8]
+        self._cache.set(f"{session_id}:{name}", (version, frame), tag=session_id)
+        return f"{session_id}:{name}:{version}"
+
+    def get(self, handle: Optional[str]) -> Any:
+        """Return the result of ``handle`` or ``None`` if it is gone."""
+        if not handle:
+            return None
+        key, version = handle.rsplit(":", 1)
+        entry = self._cache.get(key)
+        if entry is None or entry[0] != version:
+            return None
+        return entry[1]
+
+    def drop_session(self, session_id: str) -> None:
+        self._cache.evict(session_id)
+
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+
+_store: Optional[ResultStore] = None
+_store_pid: Optional[int] = None
+_store_lock = Lock()
+
+
+def get_result_store() -> ResultStore:
+    # SQLite connections must not be shared with forked job processes
+    global _store, _store_pid
+    with _store_lock:
+        if _store is None or _store_pid != os.getpid():
+            _store, _store_pid = ResultStore(), os.getpid()
+        return _store
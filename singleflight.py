@@ -0,0 +1,78 @@
+from concurrent.futures import Future
+from dataclasses import asdict, dataclass
+from threading import Lock
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+@dataclass
+class FlightStats:
+    """Counters of one :class:`SingleFlight` group."""
+
+    calls: int = 0
+    executed: int = 0
+    shared: int = 0
+    errors: int = 0
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one execution.
+
+    The first caller of a key runs the function; callers arriving while it
+    is in flight wait for it and get the same result or exception. Nothing
+    is cached afterwards, so the next call after completion runs again.
+    Results are shared objects and must not be mutated by callers.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, Future] = {}
+        self._lock = Lock()
+        self._stats = FlightStats()
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        with self._lock:
+            self._stats.calls += 1
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                self._stats.executed += 1
+            else:
+                self._stats.shared += 1
+        if not leader:
+            return future.result()
+
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as exc:
+            future.set_exception(exc)
+            with self._lock:
+                self._stats.errors += 1
+        finally:
+            with self._lock:
+                del self._inflight[key]
+        return future.result()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return asdict(self._stats)
+
+
+_groups: Dict[str, SingleFlight] = {}
+_groups_lock = Lock()
+
+
+def group(name: str) -> SingleFlight:
+    """Return the process-wide :class:`SingleFlight` named ``name``."""
+    with _groups_lock:
+        flight = _groups.get(name)
+        if flight is None:
+            flight = _groups[name] = SingleFlight(name)
+        return flight
+
+
+def get_stats(name: Optional[str] = None) -> Dict[str, Dict[str, int]]:
+    """Return the counters of every group (or only ``name``); ``shared`` is calls saved."""
+    with _groups_lock:
+        groups = dict(_groups)
+    return {n: g.stats() for n, g in groups.items() if name is None or n == name}
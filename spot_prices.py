@@ -0,0 +1,204 @@
+import json
+import os
+from datetime import date, timedelta
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import requests
+
+import singleflight
+from columnar import load_columns, save_columns
+from metering_store import as_date
+from process_lock import file_lock
+
+# Energi Data Service publishes 15-minute DayAheadPrices from 2025-10-01 (UTC)
+# and kept the hourly Elspotprices for the days before. Any endpoint returning
+# {"records": [...]} with the fields below can be used, e.g. a local stand-in.
+SPOT_PRICE_API_URL = os.environ.get("SPOT_PRICE_API_URL", "https://api.energidataservice.dk/dataset/DayAheadPrices")
+SPOT_PRICE_TIME_FIELD = os.environ.get("SPOT_PRICE_TIME_FIELD", "TimeUTC")
+SPOT_PRICE_VALUE_FIELD = os.environ.get("SPOT_PRICE_VALUE_FIELD", "DayAheadPriceDKK")
+SPOT_PRICE_HISTORY_API_URL = os.environ.get("SPOT_PRICE_HISTORY_API_URL",
+                                            "https://api.energidataservice.dk/dataset/Elspotprices")
+SPOT_PRICE_HISTORY_TIME_FIELD = os.environ.get("SPOT_PRICE_HISTORY_TIME_FIELD", "HourUTC")
+SPOT_PRICE_HISTORY_VALUE_FIELD = os.environ.get("SPOT_PRICE_HISTORY_VALUE_FIELD", "SpotPriceDKK")
+# First UTC day served by SPOT_PRICE_API_URL; earlier days come from the history dataset
+SPOT_PRICE_HISTORY_UNTIL = date.fromisoformat(os.environ.get("SPOT_PRICE_HISTORY_UNTIL", "2025-10-01"))
+SPOT_PRICE_CACHE_DIR = os.environ.get("SPOT_PRICE_CACHE_DIR", os.path.join("cache", "spot_prices"))
+# Longest period requested in one call
+SPOT_PRICE_FETCH_DAYS = int(os.environ.get("SPOT_PRICE_FETCH_DAYS", "366"))
+PRICE_AREAS = ("DK1", "DK2")
+
+_flight = singleflight.group("spot_prices")
+
+
+def _fetch_records(url: str, time_field: str, value_field: str, area: str,
+                   start: date, end: date) -> Tuple[np.ndarray, np.ndarray]:
+    # The endpoint may filter on local time, so ask for a day either side
+    params = {
+        "start": (start - timedelta(days=1)).isoformat(),
+        "end": (end + timedelta(days=1)).isoformat(),
+        "filter": json.dumps({"PriceArea": [area]}),
+        "sort": f"{time_field} asc",
+        "limit": 0,
+    }
+    resp = requests.get(url, params=params, timeout=60)
+    resp.raise_for_status()
+    records = [r for r in resp.json().get("records", []) if r.get(value_field) is not None]
+    times = pd.to_datetime([r[time_field] for r in records], utc=True)
+    # Prices are quoted per MWh
+    prices = np.fromiter((r[value_field] / 1000 for r in records), dtype=np.float64, count=len(records))
+    return times.as_unit("ns").asi8, prices
+
+
+def _fetch_prices(area: str, start: date, end: date) -> Tuple[np.ndarray, np.ndarray]:
+    """Fetch spot prices for the UTC days ``[start, end)``; returns (UTC ns, DKK/kWh)."""
+    parts = []
+    # The Danish day across the switch spans both datasets, so ask both near it
+    if start <= SPOT_PRICE_HISTORY_UNTIL:
+        parts.append(_fetch_records(SPOT_PRICE_HISTORY_API_URL, SPOT_PRICE_HISTORY_TIME_FIELD,
+                                    SPOT_PRICE_HISTORY_VALUE_FIELD, area, start, end))
+    if end >= SPOT_PRICE_HISTORY_UNTIL:
+        parts.append(_fetch_records(SPOT_PRICE_API_URL, SPOT_PRICE_TIME_FIELD, SPOT_PRICE_VALUE_FIELD,
+                                    area, start, end))
+    times = np.concatenate([t for t, _ in parts])
+    prices = np.concatenate([p for _, p in parts])
+    times, first = np.unique(times, return_index=True)
+    return times, prices[first]
+
+
+def _durations(times: np.ndarray) -> np.ndarray:
+    """Return the period (ns) each price covers, at most an hour.
+
+    A price covers the shorter of the steps to its neighbours, so a price
+    next to a missing hour or quarter does not also cover the gap.
+    """
+    hour = pd.Timedelta(hours=1).value
+    steps = np.diff(times)
+    if len(steps) == 0:
+        return np.full(len(times), hour)
+    return np.minimum(np.minimum(np.append(steps[0], steps), np.append(steps, steps[-1])), hour)
+
+
+def _spans(days: np.ndarray, max_days: int) -> List[Tuple[date, date]]:
+    """Group sorted ``datetime64[D]`` days into ``[start, end)`` spans of at most ``max_days``."""
+    spans: List[Tuple[date, date]] = []
+    for day in days.astype(date):
+        if spans and spans[-1][1] == day and (day - spans[-1][0]).days < max_days:
+            spans[-1] = (spans[-1][0], day + timedelta(days=1))
+        else:
+            spans.append((day, day + timedelta(days=1)))
+    return spans
+
+
+class SpotPriceStore:
+    """Persistent spot prices per price area with the UTC days already held.
+
+    Each area is one compressed columnar file with the price times, prices
+    (DKK/kWh) and the complete days, so a multi-year range is read with one
+    file load and only the missing days are requested, one call per gap.
+    """
+
+    def __init__(self, cache_dir: str = SPOT_PRICE_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self._loaded: Dict[str, Tuple[int, Dict[str, np.ndarray]]] = {}
+        self._lock = Lock()
+
+    def _path(self, area: str) -> str:
+        return os.path.join(self.cache_dir, f"{area}.npz")
+
+    def _load(self, area: str) -> Dict[str, np.ndarray]:
+        path = self._path(area)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return {
+                "time": np.empty(0, dtype=np.int64),
+                "price": np.empty(0, dtype=np.float64),
+                "day": np.empty(0, dtype="datetime64[D]"),
+            }
+        cached = self._loaded.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        columns = load_columns(path)
+        self._loaded[path] = (mtime, columns)
+        return columns
+
+    def missing_spans(self, area: str, date_from, date_to) -> List[Tuple[date, date]]:
+        wanted = np.arange(as_date(date_from), as_date(date_to), dtype="datetime64[D]")
+        return _spans(wanted[~np.isin(wanted, self._load(area)["day"])], SPOT_PRICE_FETCH_DAYS)
+
+    def _merge(self, area: str, times: np.ndarray, prices: np.ndarray) -> None:
+        # A UTC day is held once its prices cover all 24 of its hours, hourly or
+        # quarterly; days without prices are requested again on the next fill.
+        days, inverse = np.unique(times.astype("datetime64[ns]").astype("datetime64[D]"), return_inverse=True)
+        covered = np.bincount(inverse, weights=_durations(times), minlength=len(days))
+        complete = days[covered >= pd.Timedelta(days=1).value]
+        path = self._path(area)
+        with self._lock, file_lock(path + ".lock"):
+            current = self._load(area)
+            merged_times = np.concatenate([times, current["time"]])
+            merged_prices = np.concatenate([prices, current["price"]])
+            merged_times, first = np.unique(merged_times, return_index=True)
+            save_columns(path, {
+                "time": merged_times,
+                "price": merged_prices[first],
+                "day": np.union1d(current["day"], complete),
+            })
+
+    def fill(self, area: str, date_from, date_to) -> None:
+        """Fetch the days in ``[date_from, date_to)`` that are not held yet."""
+        for start, end in self.missing_spans(area, date_from, date_to):
+            times, prices = _flight.do((area, start, end), _fetch_prices, area, start, end)
+            self._merge(area, times, prices)
+
+    def series(self, area: str, date_from, date_to) -> pd.Series:
+        """Return the prices (DKK/kWh) of the UTC days ``[date_from, date_to)``, filling gaps first."""
+        self.fill(area, date_from, date_to)
+        columns = self._load(area)
+        lo = np.searchsorted(columns["time"], pd.Timestamp(as_date(date_from)).value, side="left")
+        hi = np.searchsorted(columns["time"], pd.Timestamp(as_date(date_to)).value, side="left")
+        index = pd.DatetimeIndex(pd.to_datetime(columns["time"][lo:hi], utc=True), name="time")
+        return pd.Series(columns["price"][lo:hi], index=index, name=area)
+
+    def align(self, area: str, index: pd.DatetimeIndex) -> np.ndarray:
+        """Return the spot price (DKK/kWh) in effect at each timestamp of ``index``.
+
+        ``index`` is typically a consumption index of any resolution; each
+        timestamp gets the price of the period it falls in, or NaN where no
+        price is known.
+        """
+        if len(index) == 0:
+            return np.empty(0)
+        if index.tz is None:
+            index = index.tz_localize("UTC")
+        utc = index.tz_convert("UTC")
+        prices = self.series(area, utc.min().date(), utc.max().date() + timedelta(days=1))
+        times = prices.index.as_unit("ns").asi8
+        stamps = utc.as_unit("ns").asi8
+        if len(times) == 0:
+            return np.full(len(index), np.nan)
+        pos = np.searchsorted(times, stamps, side="right") - 1
+        # A price covers its own period: an hour before the switch, a quarter after
+        valid = (pos >= 0) & (stamps - times[np.maximum(pos, 0)] < _durations(times)[np.maximum(pos, 0)])
+        return np.where(valid, prices.to_numpy()[np.maximum(pos, 0)], np.nan)
+
+
+_store: Optional[SpotPriceStore] = None
+_store_lock = Lock()
+
+
+def get_spot_price_store() -> SpotPriceStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SpotPriceStore()
+        return _store
+
+
+def spot_prices_for(index: pd.DatetimeIndex, area: str = "DK1") -> np.ndarray:
+    """Return spot prices (DKK/kWh) aligned to ``index`` for ``area`` (DK1 or DK2)."""
+    if area not in PRICE_AREAS:
+        raise ValueError(f"Unknown price area {area!r}, expected one of {PRICE_AREAS}")
+    return get_spot_price_store().align(area, index)
@@ -0,0 +1,83 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Mapping, Union
+
+import numpy as np
+import pandas as pd
+
+from battery import interval_hours
+
+SWEEP_SIZES_KW = tuple(range(2, 21, 2))
+SWEEP_TILTS = (15, 25, 35, 45)
+# Default economics in DKK; prices may also be arrays aligned to the consumption
+SWEEP_IMPORT_PRICE = 2.5
+SWEEP_EXPORT_PRICE = 0.6
+SWEEP_COST_PER_KWP = 10000.0
+SWEEP_PROFILE_WORKERS = 4
+
+Price = Union[float, np.ndarray]
+# profile(azimuth, tilt, index) -> 1 kWp power (W) at each timestamp of index
+ProfileSource = Callable[[float, float, pd.DatetimeIndex], np.ndarray]
+
+
+def sweep_configurations(
+    consumption: pd.Series,
+    profile: ProfileSource,
+    orientations: Mapping[str, float],
+    sizes_kw: Iterable[float] = SWEEP_SIZES_KW,
+    tilts: Iterable[float] = SWEEP_TILTS,
+    import_price: Price = SWEEP_IMPORT_PRICE,
+    export_price: Price = SWEEP_EXPORT_PRICE,
+    cost_per_kwp: float = SWEEP_COST_PER_KWP,
+) -> pd.DataFrame:
+    """Evaluate every size, orientation and tilt against ``consumption``.
+
+    ``consumption`` is kWh per interval on a UTC index. Each distinct
+    orientation/tilt profile is requested from ``profile`` once (on a small
+    thread pool), and all sizes of that profile are evaluated together as
+    one ``sizes x time`` array, since production scales linearly with size.
+
+    Returns one row per configuration ranked by payback time, with yearly
+    production, self-consumption, export, savings and payback in years.
+    """
+    index = consumption.index
+    load = consumption.to_numpy(dtype=np.float64)
+    hours = interval_hours(index)
+    years = len(index) * hours / 8760
+    sizes = np.asarray(list(sizes_kw), dtype=np.float64)
+    import_price = np.broadcast_to(np.asarray(import_price, dtype=np.float64), load.shape)
+    export_price = np.broadcast_to(np.asarray(export_price, dtype=np.float64), load.shape)
+
+    combos = [(name, azimuth, tilt) for name, azimuth in orientations.items() for tilt in tilts]
+    with ThreadPoolExecutor(max_workers=SWEEP_PROFILE_WORKERS) as pool:
+        profiles = list(pool.map(lambda c: profile(c[1], c[2], index), combos))
+
+    rows: Dict[str, list] = {key: [] for key in (
+        "orientation", "tilt", "pv_size_kw", "production_kwh", "self_consumption_kwh",
+        "export_kwh", "self_consumption_ratio", "savings_per_year", "payback_years")}
+    for (name, _, tilt), per_kwp in zip(combos, profiles):
+        energy = np.asarray(per_kwp, dtype=np.float64) / 1000 * hours
+        production = sizes[:, None] * energy[None, :]
+        self_use = np.minimum(production, load[None, :])
+        export = production - self_use
+
+        production_kwh = production.sum(axis=1) / years
+        self_kwh = self_use.sum(axis=1) / years
+        export_kwh = export.sum(axis=1) / years
+        savings = (self_use @ import_price + export @ export_price) / years
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = np.where(production_kwh > 0, self_kwh / production_kwh, np.nan)
+            payback = np.where(savings > 0, sizes * cost_per_kwp / savings, np.inf)
+
+        rows["orientation"] += [name] * len(sizes)
+        rows["tilt"] += [tilt] * len(sizes)
+        rows["pv_size_kw"] += sizes.tolist()
+        rows["production_kwh"] += production_kwh.tolist()
+        rows["self_consumption_kwh"] += self_kwh.tolist()
+        rows["export_kwh"] += export_kwh.tolist()
+        rows["self_consumption_ratio"] += ratio.tolist()
+        rows["savings_per_year"] += savings.tolist()
+        rows["payback_years"] += payback.tolist()
+
+    result = pd.DataFrame(rows)
+    return result.sort_values(["payback_years", "savings_per_year"],
+                              ascending=[True, False], ignore_index=True)
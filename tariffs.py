@@ -0,0 +1,152 @@
+import os
+import time
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+LOCAL_TZ = "Europe/Copenhagen"
+# Charges change rarely; compiled schedules are reused for this many seconds
+TARIFF_CACHE_TTL = float(os.environ.get("TARIFF_CACHE_TTL", "86400"))
+
+_NO_END = np.iinfo(np.int64).max
+
+
+def _timestamp_ns(value: Optional[str], default: int) -> int:
+    if not value:
+        return default
+    ts = pd.Timestamp(value)
+    if ts.tz is None:
+        ts = ts.tz_localize(LOCAL_TZ)
+    return ts.value
+
+
+def _hourly_prices(tariff: dict) -> np.ndarray:
+    """Return the 24 local-hour prices (DKK/kWh) of one tariff."""
+    prices = sorted(tariff.get("prices") or [], key=lambda p: int(p.get("position", 1)))
+    values = np.array([float(p["price"]) for p in prices], dtype=np.float64)
+    if len(values) == 0:
+        return np.zeros(24)
+    if tariff.get("periodType") == "PT1H" and len(values) >= 24:
+        return values[:24]
+    # Daily tariffs (and short price lists) hold one price for all hours
+    return np.full(24, values[0])
+
+
+@dataclass
+class TariffSchedule:
+    """Hourly tariffs of a metering point compiled to arrays.
+
+    Row ``i`` of ``hourly`` holds the price per kWh for each local hour while
+    tariff ``i`` is valid in ``[starts[i], ends[i])`` (UTC ns).
+    Subscriptions are kept as a monthly amount and fees as a one-off sum,
+    since they do not depend on energy.
+    """
+
+    names: List[str]
+    starts: np.ndarray
+    ends: np.ndarray
+    hourly: np.ndarray
+    subscriptions_per_month: float = 0.0
+    fees: float = 0.0
+    _vectors: Dict[Tuple[int, int, int], np.ndarray] = field(default_factory=dict, repr=False)
+
+    def prices(self, index: pd.DatetimeIndex) -> np.ndarray:
+        """Return the summed tariff (DKK/kWh) at each timestamp of ``index``.
+
+        The vector for the most recent indexes is cached, so pricing several
+        series on the same index compiles it once.
+        """
+        if len(index) == 0:
+            return np.zeros(0)
+        if index.tz is None:
+            index = index.tz_localize("UTC")
+        stamps = index.as_unit("ns").asi8
+        key = (int(stamps[0]), int(stamps[-1]), len(stamps))
+        vector = self._vectors.get(key)
+        if vector is not None:
+            return vector
+
+        hour = index.tz_convert(LOCAL_TZ).hour.to_numpy()
+        vector = np.zeros(len(index))
+        # Timestamps are sorted, so each validity period is one slice
+        for start, end, prices in zip(self.starts, self.ends, self.hourly):
+            lo = np.searchsorted(stamps, start, side="left")
+            hi = np.searchsorted(stamps, end, side="left")
+            if hi > lo:
+                vector[lo:hi] += prices[hour[lo:hi]]
+        if len(self._vectors) >= 8:
+            self._vectors.pop(next(iter(self._vectors)))
+        self._vectors[key] = vector
+        return vector
+
+    def apply(self, index: pd.DatetimeIndex, **flows) -> pd.DataFrame:
+        """Return DKK per interval for each energy flow (kWh per interval).
+
+        ``flows`` are arrays or Series aligned to ``index``, for example
+        ``consumption=..., grid_import=..., self_consumption=...``.
+        """
+        prices = self.prices(index)
+        return pd.DataFrame({name: np.asarray(energy, dtype=np.float64) * prices
+                             for name, energy in flows.items()}, index=index)
+
+    def totals(self, index: pd.DatetimeIndex, **flows) -> Dict[str, float]:
+        """Return the total DKK of each flow, as :meth:`apply` summed per flow."""
+        prices = self.prices(index)
+        return {name: float(np.dot(np.asarray(energy, dtype=np.float64), prices))
+                for name, energy in flows.items()}
+
+    def fixed_costs(self, start, end) -> float:
+        """Return the subscriptions for ``[start, end)`` (prorated by month) plus fees."""
+        months = (pd.Timestamp(end) - pd.Timestamp(start)) / pd.Timedelta(days=365.25 / 12)
+        return self.subscriptions_per_month * months + self.fees
+
+
+def compile_charges(charges: List[dict]) -> TariffSchedule:
+    """Compile a ``getcharges`` result list into a :class:`TariffSchedule`."""
+    names, starts, ends, hourly = [], [], [], []
+    subscriptions = fees = 0.0
+    for entry in charges:
+        result = entry.get("result", entry) or {}
+        for tariff in result.get("tariffs") or []:
+            names.append(tariff.get("name", ""))
+            starts.append(_timestamp_ns(tariff.get("validFromDate"), np.iinfo(np.int64).min))
+            ends.append(_timestamp_ns(tariff.get("validToDate"), _NO_END))
+            hourly.append(_hourly_prices(tariff))
+        for subscription in result.get("subscriptions") or []:
+            subscriptions += float(subscription.get("price") or 0) * float(subscription.get("quantity") or 1)
+        for fee in result.get("fees") or []:
+            fees += float(fee.get("price") or 0) * float(fee.get("quantity") or 1)
+    return TariffSchedule(
+        names=names,
+        starts=np.array(starts, dtype=np.int64),
+        ends=np.array(ends, dtype=np.int64),
+        hourly=np.array(hourly, dtype=np.float64).reshape(len(hourly), 24),
+        subscriptions_per_month=subscriptions,
+        fees=fees,
+    )
+
+
+class TariffCache:
+    """Compiled tariff schedules per metering point, refreshed after ``ttl`` seconds."""
+
+    def __init__(self, ttl: float = TARIFF_CACHE_TTL):
+        self.ttl = ttl
+        self._schedules: Dict[Tuple[str, str], Tuple[float, TariffSchedule]] = {}
+        self._lock = Lock()
+
+    def get(self, token: str, metering_point_id: str,
+            fetch: Callable[[str, str], List[dict]]) -> TariffSchedule:
+        """Return the schedule, calling ``fetch(token, metering_point_id)`` when missing or stale."""
+        key = (token, metering_point_id)
+        with self._lock:
+            cached = self._schedules.get(key)
+        if cached is not None and time.time() - cached[0] < self.ttl:
+            return cached[1]
+        schedule = compile_charges(fetch(token, metering_point_id))
+        with self._lock:
+            self._schedules[key] = (time.time(), schedule)
+        return schedule
+
@@ -0,0 +1,49 @@
+import json
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import functions
+
+METERING_POINT = "571313100000000001"
+
+
+def _daily_result(start, days):
+    return [{"MyEnergyData_MarketDocument": {"TimeSeries": [{
+        "mRID": METERING_POINT,
+        "Period": [{
+            "resolution": "P1D",
+            "timeInterval": {"start": start},
+            "Point": [{"position": str(i + 1), "out_Quantity.quantity": str(float(i))}
+                      for i in range(days)],
+        }],
+    }]}}]
+
+
+@pytest.mark.parametrize("start, days", [
+    # Across the October change (2024-10-27) and the March change (2025-03-30)
+    ("2024-10-24T22:00:00Z", 8),
+    ("2025-03-26T23:00:00Z", 8),
+])
+def test_daily_points_start_at_local_midnight(start, days):
+    result = _daily_result(start, days)
+    expected = pd.date_range(pd.Timestamp(start).tz_convert("Europe/Copenhagen"), periods=days, freq="D")
+
+    parsed = functions._data_to_dataframe(result)
+    streamed = functions._columns_to_dataframe(
+        functions._stream_metering_data(BytesIO(json.dumps({"result": result}).encode()))[0])
+
+    for frame in (parsed, streamed):
+        local = frame.index.tz_convert("Europe/Copenhagen")
+        assert (local == expected).all()
+        assert (local.hour == 0).all()
+
+
+def test_daily_points_match_local_resample():
+    hours = pd.date_range("2024-10-24T22:00:00Z", "2024-11-01T23:00:00Z", freq="h", inclusive="left")
+    hourly = pd.DataFrame({METERING_POINT: np.ones(len(hours))}, index=hours)
+    daily = functions._data_to_dataframe(_daily_result("2024-10-24T22:00:00Z", 8))
+
+    assert functions._resample_local(hourly, "Day").index.equals(daily.index)
@@ -0,0 +1,43 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from spot_prices import SpotPriceStore
+
+
+def _merge(store, start, end, freq):
+    times = pd.date_range(start, end, freq=freq, inclusive="left", tz="UTC").as_unit("ns").asi8
+    store._merge("DK1", times, np.ones(len(times)))
+
+
+@pytest.mark.parametrize("freq", ["h", "15min"])
+def test_day_missing_last_hour_is_not_held(tmp_path, freq):
+    store = SpotPriceStore(str(tmp_path))
+    # Published through Danish midnight in winter, 23:00 UTC
+    _merge(store, "2026-01-14", "2026-01-15T23:00", freq)
+
+    assert store.missing_spans("DK1", date(2026, 1, 14), date(2026, 1, 16)) == [
+        (date(2026, 1, 15), date(2026, 1, 16))]
+
+
+@pytest.mark.parametrize("freq", ["h", "15min"])
+def test_day_with_gap_is_not_held(tmp_path, freq):
+    store = SpotPriceStore(str(tmp_path))
+    times = pd.date_range("2026-01-15", "2026-01-16", freq=freq, inclusive="left", tz="UTC")
+    times = times[times != pd.Timestamp("2026-01-15T12:00", tz="UTC")].as_unit("ns").asi8
+    store._merge("DK1", times, np.ones(len(times)))
+
+    assert store.missing_spans("DK1", date(2026, 1, 15), date(2026, 1, 16)) == [
+        (date(2026, 1, 15), date(2026, 1, 16))]
+
+
+def test_day_across_dataset_switch_is_held(tmp_path):
+    store = SpotPriceStore(str(tmp_path))
+    hourly = pd.date_range("2025-09-30", "2025-09-30T22:00", freq="h", inclusive="left", tz="UTC")
+    quarters = pd.date_range("2025-09-30T22:00", "2025-10-01", freq="15min", inclusive="left", tz="UTC")
+    times = hourly.append(quarters).as_unit("ns").asi8
+    store._merge("DK1", times, np.ones(len(times)))
+
+    assert store.missing_spans("DK1", date(2025, 9, 30), date(2025, 10, 1)) == []
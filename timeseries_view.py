@@ -0,0 +1,125 @@
+import os
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+CHART_MAX_POINTS = int(os.environ.get("CHART_MAX_POINTS", "2000"))
+# A level is downsampled with LTTB when it has up to this many times the
+# point budget in the window; beyond that the next coarser level is used.
+LTTB_FACTOR = 4
+LOCAL_TZ = "Europe/Copenhagen"
+
+# Levels from finest to coarsest with their pandas resample rule; "raw" is
+# the fetched resolution. Periods start at Danish local midnight.
+PYRAMID_LEVELS = {
+    "raw": None,
+    "hour": "h",
+    "day": "D",
+    "week": "W-MON",
+    "month": "MS",
+}
+
+Pyramid = Dict[str, pd.DataFrame]
+
+
+def build_pyramid(frame: pd.DataFrame) -> Pyramid:
+    """Return ``frame`` summed to every level of :data:`PYRAMID_LEVELS`.
+
+    ``frame`` holds energy per interval on a UTC index. Hours are summed from
+    the raw rows and every coarser level from the days, in Danish local
+    time; all levels keep a UTC index.
+    """
+    raw = frame.sort_index()
+    hour = raw.tz_convert(LOCAL_TZ).resample("h").sum(min_count=1)
+    day = hour.resample("D").sum(min_count=1)
+    levels = {
+        "raw": raw,
+        "hour": hour,
+        "day": day,
+        # Weeks start on Monday and are labelled with it
+        "week": day.resample("W-MON", closed="left", label="left").sum(min_count=1),
+        "month": day.resample("MS").sum(min_count=1),
+    }
+    return {level: data if level == "raw" else data.dropna(how="all").tz_convert("UTC")
+            for level, data in levels.items()}
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Return the indices kept by Largest-Triangle-Three-Buckets downsampling.
+
+    ``x`` must be increasing. The first and last points are always kept and
+    one point is chosen per bucket so that it spans the largest triangle with
+    the previously chosen point and the mean of the next bucket, which keeps
+    peaks and the overall shape of the series.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = x.astype(np.float64)
+    y = np.nan_to_num(y.astype(np.float64))
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    # Mean of each bucket, used as the third triangle corner for the previous one
+    sums_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1)
+    counts = np.diff(edges)
+    mean_x = np.append(sums_x / counts, x[-1])
+    mean_y = np.append(sums_y / counts, y[-1])
+
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for bucket in range(threshold - 2):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        cx, cy = mean_x[bucket + 1], mean_y[bucket + 1]
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        kept[bucket + 1] = a
+    return kept
+
+
+def _window_bounds(index: pd.DatetimeIndex, start, end) -> Tuple[int, int]:
+    values = index.as_unit("ns").asi8
+    lo = 0 if start is None else int(np.searchsorted(values, pd.Timestamp(start).value, side="left"))
+    hi = len(values) if end is None else int(np.searchsorted(values, pd.Timestamp(end).value, side="right"))
+    return lo, hi
+
+
+def select_view(pyramid: Pyramid, start=None, end=None,
+                max_points: int = CHART_MAX_POINTS) -> Tuple[str, pd.DataFrame]:
+    """Return the level and rows to draw for the window ``[start, end]``.
+
+    Levels are tried from finest to coarsest. A level with at most
+    ``max_points`` rows in the window is used as is; one with at most
+    ``LTTB_FACTOR`` times as many is reduced with :func:`lttb` on the row
+    totals, so every column keeps the same timestamps. The coarsest level is
+    always drawn, downsampled if needed.
+    """
+    levels = [level for level in PYRAMID_LEVELS if level in pyramid]
+    for level in levels:
+        frame = pyramid[level]
+        lo, hi = _window_bounds(frame.index, start, end)
+        window = frame.iloc[lo:hi]
+        if len(window) <= max_points:
+            return level, window
+        if len(window) <= max_points * LTTB_FACTOR or level == levels[-1]:
+            kept = lttb(window.index.asi8, window.sum(axis=1).to_numpy(), max_points)
+            return level, window.iloc[kept]
+
+
+def relayout_window(relayout: Optional[dict]) -> Tuple[Optional[pd.Timestamp], Optional[pd.Timestamp]]:
+    """Return the x range of a Plotly ``relayoutData`` event, or ``(None, None)`` for the full range.
+
+    The chart is drawn in Danish local time, so naive range strings are
+    read as local timestamps.
+    """
+    if not relayout or relayout.get("xaxis.autorange"):
+        return None, None
+    if "xaxis.range[0]" in relayout:
+        bounds = relayout["xaxis.range[0]"], relayout["xaxis.range[1]"]
+    elif "xaxis.range" in relayout:
+        bounds = relayout["xaxis.range"][:2]
+    else:
+        return None, None
+    stamps = [pd.Timestamp(b) for b in bounds]
+    return tuple(t.tz_localize(LOCAL_TZ) if t.tz is None else t for t in stamps)
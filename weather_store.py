@@ -0,0 +1,198 @@
+import json
+import os
+from collections import defaultdict
+from datetime import date
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from columnar import load_columns, save_columns
+
+WEATHER_STORE_DIR = os.environ.get("WEATHER_STORE_DIR", os.path.join("cache", "weather"))
+STATIONS_FILE = "stations.npz"
+
+_COLUMNS = ("time", "station", "parameter", "value")
+
+
+def _partition_path(month: Tuple[int, int], store_dir: str = WEATHER_STORE_DIR) -> str:
+    return os.path.join(store_dir, "{:04d}-{:02d}.npz".format(*month))
+
+
+def _read_day(path: str, coordinates: Dict[str, Tuple[float, float]]) -> Tuple[list, list, list, list]:
+    """Return station, parameter, observed and value lists of one day file."""
+    with open(path) as f:
+        features = json.load(f).get("features", [])
+    stations, parameters, observed, values = [], [], [], []
+    for feature in features:
+        properties = feature.get("properties", {})
+        if properties.get("value") is None:
+            continue
+        station = properties.get("stationId") or ""
+        stations.append(station)
+        parameters.append(properties.get("parameterId") or "")
+        # "2024-01-01T00:10:00Z" -> second resolution without the zone suffix
+        observed.append(properties["observed"][:19])
+        values.append(properties["value"])
+        geometry = feature.get("geometry") or {}
+        if station not in coordinates and geometry.get("coordinates"):
+            lon, lat = geometry["coordinates"][:2]
+            coordinates[station] = (float(lon), float(lat))
+    return stations, parameters, observed, values
+
+
+def compact_month(month: Tuple[int, int], day_files: Mapping[date, str],
+                  store_dir: str = WEATHER_STORE_DIR) -> Dict[str, Tuple[float, float]]:
+    """Write the daily JSON files of one month as a columnar partition.
+
+    Stations and parameters are dictionary-encoded; rows are sorted by
+    parameter, station and time. The included days are stored with the data
+    so the partition can be compared against the cache later. Returns the
+    station coordinates found in the files.
+    """
+    coordinates: Dict[str, Tuple[float, float]] = {}
+    stations, parameters, observed, values = [], [], [], []
+    for day in sorted(day_files):
+        s, p, o, v = _read_day(day_files[day], coordinates)
+        stations += s
+        parameters += p
+        observed += o
+        values += v
+
+    station_names, station_codes = np.unique(np.array(stations, dtype=str), return_inverse=True)
+    parameter_names, parameter_codes = np.unique(np.array(parameters, dtype=str), return_inverse=True)
+    times = np.array(observed, dtype="datetime64[s]").astype("datetime64[ns]").astype(np.int64)
+    order = np.lexsort((times, station_codes, parameter_codes))
+    save_columns(_partition_path(month, store_dir), {
+        "time": times[order],
+        "station": station_codes[order].astype(np.uint16),
+        "parameter": parameter_codes[order].astype(np.uint8),
+        "value": np.asarray(values, dtype=np.float32)[order],
+        "stations": station_names,
+        "parameters": parameter_names,
+        "days": np.array(sorted(day_files), dtype="datetime64[D]"),
+    })
+    return coordinates
+
+
+def _partition_days(path: str) -> np.ndarray:
+    try:
+        return load_columns(path, ["days"])["days"]
+    except (FileNotFoundError, KeyError, ValueError):
+        return np.empty(0, dtype="datetime64[D]")
+
+
+def compact(day_files: Mapping[date, str], store_dir: str = WEATHER_STORE_DIR) -> int:
+    """Compact daily JSON files into monthly partitions.
+
+    Months whose partition already holds exactly the given days are skipped,
+    so repeated calls only rewrite months that gained days. Returns the
+    number of partitions written.
+    """
+    months: Dict[Tuple[int, int], Dict[date, str]] = defaultdict(dict)
+    for day, path in day_files.items():
+        months[(day.year, day.month)][day] = path
+
+    written = 0
+    coordinates: Dict[str, Tuple[float, float]] = {}
+    for month, files in sorted(months.items()):
+        held = _partition_days(_partition_path(month, store_dir))
+        if np.array_equal(held, np.array(sorted(files), dtype="datetime64[D]")):
+            continue
+        coordinates.update(compact_month(month, files, store_dir))
+        written += 1
+    if coordinates:
+        _save_stations(coordinates, store_dir)
+    return written
+
+
+def _save_stations(coordinates: Dict[str, Tuple[float, float]], store_dir: str) -> None:
+    known = load_stations(store_dir)
+    merged = dict(zip(known.index, zip(known["lon"], known["lat"])))
+    merged.update(coordinates)
+    names = sorted(merged)
+    save_columns(os.path.join(store_dir, STATIONS_FILE), {
+        "station": np.array(names, dtype=str),
+        "lon": np.array([merged[n][0] for n in names], dtype=np.float64),
+        "lat": np.array([merged[n][1] for n in names], dtype=np.float64),
+    })
+
+
+def load_stations(store_dir: str = WEATHER_STORE_DIR) -> pd.DataFrame:
+    """Return the ``lon``/``lat`` of every station seen, indexed by station id."""
+    path = os.path.join(store_dir, STATIONS_FILE)
+    if not os.path.exists(path):
+        return pd.DataFrame({"lon": [], "lat": []}, index=pd.Index([], name="station", dtype=str))
+    columns = load_columns(path)
+    return pd.DataFrame({"lon": columns["lon"], "lat": columns["lat"]},
+                        index=pd.Index(columns["station"], name="station"))
+
+
+def _months(start: date, end: date) -> List[Tuple[int, int]]:
+    months = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def utc_naive(value) -> pd.Timestamp:
+    ts = pd.Timestamp(value)
+    return ts if ts.tz is None else ts.tz_convert("UTC").tz_localize(None)
+
+
+def _codes(names: np.ndarray, wanted: Optional[Iterable[str]]) -> Optional[np.ndarray]:
+    if wanted is None:
+        return None
+    return np.flatnonzero(np.isin(names, list(wanted)))
+
+
+def load_weather(start, end, stations: Optional[Iterable[str]] = None,
+                 parameters: Optional[Iterable[str]] = None,
+                 store_dir: str = WEATHER_STORE_DIR) -> pd.DataFrame:
+    """Return observations with ``start <= time < end`` from the partitions.
+
+    ``start`` and ``end`` are UTC dates or timestamps. The result has one row
+    per observation with the columns ``time`` (UTC), ``station``,
+    ``parameter`` and ``value``. Only the month partitions overlapping the
+    range are opened; the small code columns are read first and the time
+    and value columns only for partitions that contain a requested station
+    and parameter.
+    """
+    lo, hi = utc_naive(start), utc_naive(end)
+    parts: Dict[str, list] = {name: [] for name in _COLUMNS}
+    for month in _months(lo.date(), (hi - pd.Timedelta(1)).date()):
+        path = _partition_path(month, store_dir)
+        if not os.path.exists(path):
+            continue
+        codes = load_columns(path, ["station", "parameter", "stations", "parameters"])
+        mask = np.ones(len(codes["station"]), dtype=bool)
+        wanted = _codes(codes["stations"], stations)
+        if wanted is not None:
+            mask &= np.isin(codes["station"], wanted)
+        wanted = _codes(codes["parameters"], parameters)
+        if wanted is not None:
+            mask &= np.isin(codes["parameter"], wanted)
+        if not mask.any():
+            continue
+        data = load_columns(path, ["time", "value"])
+        mask &= (data["time"] >= lo.value) & (data["time"] < hi.value)
+        parts["time"].append(data["time"][mask])
+        parts["value"].append(data["value"][mask])
+        parts["station"].append(codes["stations"][codes["station"][mask]])
+        parts["parameter"].append(codes["parameters"][codes["parameter"][mask]])
+
+    if not parts["time"]:
+        return pd.DataFrame({
+            "time": pd.DatetimeIndex([], dtype="datetime64[ns, UTC]"),
+            "station": pd.Series([], dtype=str),
+            "parameter": pd.Series([], dtype=str),
+            "value": pd.Series([], dtype=np.float32),
+        })
+    return pd.DataFrame({
+        "time": pd.DatetimeIndex(np.concatenate(parts["time"])).tz_localize("UTC"),
+        "station": np.concatenate(parts["station"]),
+        "parameter": np.concatenate(parts["parameter"]),
+        "value": np.concatenate(parts["value"]),
+    })
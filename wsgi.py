@@ -0,0 +1,15 @@
+"""
+Production entry point for multi-process serving:
+
+    gunicorn --workers 4 --bind 0.0.0.0:8050 wsgi:server
+
+Every worker starts the DMI cache thread, but only the worker holding the
+cache lock updates it (see ``dmi_cache._worker``). Do not use ``--preload``:
+threads started in the gunicorn master do not survive the fork.
+"""
+
+from app import app
+from dmi_cache import start_dmi_cache_worker
+
+start_dmi_cache_worker()
+server = app.server